@@ -40,8 +40,44 @@ scene.add(rimLight);
 const listener = new THREE.AudioListener();
 camera.add(listener);
 const vesiSound = new THREE.Audio(listener);
+// Live FFT, only used when a clip comes without a lip sync envelope
 const analyser = new THREE.AudioAnalyser(vesiSound, 256);
 
+// Lip sync envelope of the clip that is playing (from the server), and when it started
+let currentLipsync = null;
+let lipsyncStart = 0;
+
+function playClip(buffer, lipsync) {
+    if (vesiSound.isPlaying) vesiSound.stop();
+    vesiSound.setBuffer(buffer);
+    currentLipsync = lipsync || null;
+    lipsyncStart = vesiSound.context.currentTime;
+    vesiSound.play();
+}
+
+// Envelope value at `t` seconds into the clip, linearly interpolated between frames
+function sampleEnvelope(values, fps, t) {
+    const position = t * fps;
+    const i = Math.floor(position);
+    if (i < 0 || i >= values.length) return 0;
+    const next = i + 1 < values.length ? values[i + 1] : 0;
+    return values[i] + (next - values[i]) * (position - i);
+}
+
+// Use /chat/stream (tokens + sentence audio as they're ready) instead of one-shot /chat
+const STREAM_CHAT = true;
+
+// Conversation to talk in — open index.html?session=<name> for a separate history and mood
+const SESSION_ID = new URLSearchParams(window.location.search).get('session') || 'default';
+
+// Smallest speech format this browser can decode; the server falls back to wav if it can't encode it
+const AUDIO_FORMAT = (() => {
+    const probe = document.createElement('audio');
+    if (probe.canPlayType('audio/ogg; codecs=opus')) return 'opus';
+    if (probe.canPlayType('audio/flac')) return 'flac';
+    return 'wav';
+})();
+
 // Load VRM
 let currentVrm = null;
 const loader = new GLTFLoader();
@@ -127,10 +163,25 @@ function animate() {
     idleTime += deltaTime;
     
     if (currentVrm) {
-        // Lip flap anim
-        const volume = analyser.getAverageFrequency();
-        const mouthOpen = Math.min(volume / 40, 1.0);
-        currentVrm.expressionManager.setValue('aa', mouthOpen);
+        // Lip flap anim: precomputed envelope if the server sent one, live FFT otherwise
+        if (currentLipsync && vesiSound.isPlaying) {
+            const t = (vesiSound.context.currentTime - lipsyncStart) * vesiSound.playbackRate;
+            const { fps, visemes } = currentLipsync;
+            if (visemes) {
+                for (const [name, values] of Object.entries(visemes)) {
+                    currentVrm.expressionManager.setValue(name, sampleEnvelope(values, fps, t));
+                }
+            } else {
+                currentVrm.expressionManager.setValue('aa', sampleEnvelope(currentLipsync.open, fps, t));
+            }
+        } else if (currentLipsync) {
+            for (const name of ['aa', 'ih', 'ou']) currentVrm.expressionManager.setValue(name, 0);
+            currentLipsync = null;
+        } else {
+            const volume = analyser.getAverageFrequency();
+            const mouthOpen = Math.min(volume / 40, 1.0);
+            currentVrm.expressionManager.setValue('aa', mouthOpen);
+        }
         
         // full idle anim
         
@@ -165,6 +216,34 @@ function animate() {
 animate();
 
 // Chat
+// The reply in flight, so a new message or the mic can interrupt it (barge-in)
+let currentRequestId = null;
+let currentAbort = null;
+
+function bargeIn() {
+    if (currentRequestId) {
+        // Frees the GPU: the server stops generating and synthesizing at once
+        fetch('http://127.0.0.1:8000/chat/cancel', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ request_id: currentRequestId })
+        }).catch((err) => console.error("Cancel error:", err));
+        currentAbort.abort();
+        currentRequestId = null;
+    }
+    if (vesiSound.isPlaying) vesiSound.stop();
+    pendingAudio = new Map();
+    nextAudioIndex = 0;
+    streamGeneration++;
+}
+
+function startRequest() {
+    bargeIn();
+    currentRequestId = crypto.randomUUID();
+    currentAbort = new AbortController();
+    return currentRequestId;
+}
+
 async function sendMessage(event) {
     if (event) event.preventDefault();
 
@@ -173,6 +252,7 @@ async function sendMessage(event) {
     if (!text) return;
 
     input.value = ''; 
+    clearTimeout(draftTimer);
 
     console.log("Raw input:", JSON.stringify(text));
     console.log("Starts with /remember:", text.startsWith('/remember '));
@@ -198,32 +278,131 @@ async function sendMessage(event) {
         return;
     }
 
+    if (STREAM_CHAT) {
+        await streamMessage(text);
+        return;
+    }
+
     // 127 to local
+    const requestId = startRequest();
     try {
         const response = await fetch('http://127.0.0.1:8000/chat', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ message: text })
+            body: JSON.stringify({ message: text, session_id: SESSION_ID, audio_format: AUDIO_FORMAT, request_id: requestId }),
+            signal: currentAbort.signal
         });
 
+        if (!response.ok) {
+            await requestFailed(response, requestId);
+            return;
+        }
         const data = await response.json();
         console.log("Data received:", data);
+        if (data.cancelled || requestId !== currentRequestId) return;
+        currentRequestId = null;
 
         updateMoodBar(data.mood);
 
         if (typeof vesiSound !== 'undefined' && data.audio_url) {
             const audioLoader = new THREE.AudioLoader();
-            audioLoader.load(data.audio_url, (buffer) => {
-                if (vesiSound.isPlaying) vesiSound.stop();
-                vesiSound.setBuffer(buffer);
-                vesiSound.play();
-            });
+            audioLoader.load(data.audio_url, (buffer) => playClip(buffer, data.lipsync));
         } else {
             console.warn("vesiSound is not defined or no audio_url received");
         }
 
     } catch (err) {
-        console.error("Fetch Error:", err);
+        if (err.name !== 'AbortError') console.error("Fetch Error:", err);
+    }
+}
+
+// Server refused the turn (503 busy, 409 duplicate id, ...): report it and forget the request
+async function requestFailed(response, requestId) {
+    const body = await response.json().catch(() => ({}));
+    console.error(`Chat failed (${response.status}):`, body.detail || response.statusText);
+    if (requestId === currentRequestId) currentRequestId = null;
+}
+
+// Streaming chat: tokens + per-sentence audio over SSE
+// Sentences can finish loading out of order, so they're slotted by index
+let pendingAudio = new Map();
+let nextAudioIndex = 0;
+let streamGeneration = 0;   // Drops late audio from an interrupted reply
+
+function playNextAudio() {
+    if (vesiSound.isPlaying || !pendingAudio.has(nextAudioIndex)) return;
+    const { buffer, lipsync } = pendingAudio.get(nextAudioIndex);
+    pendingAudio.delete(nextAudioIndex);
+    nextAudioIndex++;
+    playClip(buffer, lipsync);
+}
+
+// Chain the next sentence when one finishes playing
+vesiSound.onEnded = function () {
+    this.isPlaying = false;
+    playNextAudio();
+};
+
+function handleStreamEvent(event, data, generation) {
+    if (event === 'token') {
+        console.log("Token:", data.text);
+    } else if (event === 'audio') {
+        const audioLoader = new THREE.AudioLoader();
+        audioLoader.load(data.audio_url, (buffer) => {
+            if (generation !== streamGeneration) return;
+            pendingAudio.set(data.index, { buffer, lipsync: data.lipsync });
+            playNextAudio();
+        });
+    } else if (event === 'done') {
+        console.log("Data received:", data);
+        updateMoodBar(data.mood);
+        if (data.request_id === currentRequestId) currentRequestId = null;
+    }
+}
+
+async function streamMessage(text) {
+    // New message interrupts whatever Vesi was still saying
+    const requestId = startRequest();
+    const generation = streamGeneration;
+
+    try {
+        const response = await fetch('http://127.0.0.1:8000/chat/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ message: text, session_id: SESSION_ID, audio_format: AUDIO_FORMAT, request_id: requestId }),
+            signal: currentAbort.signal
+        });
+
+        if (!response.ok) {
+            await requestFailed(response, requestId);
+            return;
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE events are separated by a blank line
+            let sep;
+            while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                const raw = buffer.slice(0, sep);
+                buffer = buffer.slice(sep + 2);
+
+                let event = 'message';
+                let data = '';
+                for (const line of raw.split('\n')) {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                if (data) handleStreamEvent(event, JSON.parse(data), generation);
+            }
+        }
+    } catch (err) {
+        if (err.name !== 'AbortError') console.error("Stream Error:", err);
     }
 }
 
@@ -247,12 +426,81 @@ chatForm.addEventListener('submit', function(e) {
     return false;
 });
 
+// Speculative prefill: the server starts on the message while it is being typed
+const DRAFT_DEBOUNCE_MS = 300;
+let draftTimer = null;
+
+document.getElementById('chat-input').addEventListener('input', function() {
+    clearTimeout(draftTimer);
+    const text = this.value.trim();
+    if (!text || text.startsWith('/')) return;    // Commands aren't messages
+    draftTimer = setTimeout(() => {
+        fetch('http://127.0.0.1:8000/chat/draft', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ text: text, session_id: SESSION_ID })
+        }).catch(() => {});    // Only an optimization
+    }, DRAFT_DEBOUNCE_MS);
+});
+
 let mediaRecorder;
 let audioChunks = [];
 let isRecording = false;
 
+// Transcribe over a WebSocket while the mic is held (partials as you speak),
+// falling back to uploading the whole clip to /transcribe
+const STREAM_STT = true;
+const STT_CHUNK_MS = 250;
+
+function useTranscript(transcribedText) {
+    document.getElementById('chat-input').value = transcribedText;
+
+    // Auto send timeout ms
+    setTimeout(() => {
+        sendMessage();
+    }, 1000);
+}
+
+function openSttSocket() {
+    // The session lets partial transcripts double as drafts (speculative prefill)
+    const socket = new WebSocket(`ws://127.0.0.1:8000/transcribe/stream?session_id=${encodeURIComponent(SESSION_ID)}`);
+    socket.failed = false;
+    // Chunks are chained behind the open so the first one (with the container header) is never dropped
+    socket.sendChain = new Promise((resolve) => { socket.onopen = resolve; });
+    socket.onclose = () => { socket.failed = true; };
+    socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type === 'partial') {
+            document.getElementById('chat-input').value = data.text;
+        } else if (data.type === 'final') {
+            useTranscript(data.text);
+        }
+    };
+    socket.onerror = (err) => console.error("STT socket error:", err);
+    return socket;
+}
+
+async function uploadRecording(audioBlob) {
+    const formData = new FormData();
+    formData.append('audio', audioBlob, 'recording.wav');
+
+    try {
+        const response = await fetch('http://127.0.0.1:8000/transcribe', {
+            method: 'POST',
+            body: formData
+        });
+
+        const data = await response.json();
+        useTranscript(data.text);
+
+    } catch (err) {
+        console.error("Transcription error:", err);
+    }
+}
+
 document.getElementById('mic-btn').addEventListener('mousedown', async function() {
     if (isRecording) return;
+    bargeIn();    // Talking over Vesi stops her
     
     const micBtn = this;
     isRecording = true;
@@ -260,42 +508,33 @@ document.getElementById('mic-btn').addEventListener('mousedown', async function(
     try {
         const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
         mediaRecorder = new MediaRecorder(stream);
+        const socket = STREAM_STT ? openSttSocket() : null;
         
         mediaRecorder.ondataavailable = (event) => {
             audioChunks.push(event.data);
+            if (socket) {
+                socket.sendChain = socket.sendChain
+                    .then(() => event.data.arrayBuffer())
+                    .then((buffer) => socket.send(buffer));
+            }
         };
         
         mediaRecorder.onstop = async () => {
             const audioBlob = new Blob(audioChunks, { type: 'audio/wav' });
             audioChunks = [];
-            
-            const formData = new FormData();
-            formData.append('audio', audioBlob, 'recording.wav');
-            
-            try {
-                const response = await fetch('http://127.0.0.1:8000/transcribe', {
-                    method: 'POST',
-                    body: formData
-                });
-                
-                const data = await response.json();
-                const transcribedText = data.text;
-                
-                document.getElementById('chat-input').value = transcribedText;
-                
-                // Auto send timeout ms
-                setTimeout(() => {
-                    sendMessage();
-                }, 1000);
-                
-            } catch (err) {
-                console.error("Transcription error:", err);
+
+            // Socket got every chunk: just ask for the final transcript
+            if (socket && !socket.failed) {
+                socket.sendChain.then(() => socket.send('end'));
+            } else {
+                await uploadRecording(audioBlob);
             }
             
             isRecording = false;
         };
         
-        mediaRecorder.start();
+        // Timeslice only matters when streaming; the chunks form one continuous recording
+        mediaRecorder.start(socket ? STT_CHUNK_MS : undefined);
         micBtn.classList.add('text-red-500');
         console.log("Recording...");
         
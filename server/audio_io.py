@@ -0,0 +1,202 @@
+### Audio I/O ###
+# In-memory audio decoding for STT. Uploads go straight from request bytes
+# to the float32 16 kHz mono buffer faster-whisper takes — no temp files.
+# Also encodes synthesized speech for the client: WAV always, FLAC and
+# Ogg/Opus when soundfile (libsndfile) is installed, plus a lip sync
+# envelope so the client doesn't have to analyse the audio live.
+
+### Imports ###
+import io
+import wave
+import numpy as np
+from faster_whisper.audio import decode_audio as _decode_with_av
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None    # WAV only
+
+
+### Config ###
+STT_SAMPLE_RATE = 16000      # What Whisper expects
+
+# Voice-activity trim: drops silence at the start and end of push-to-talk clips
+VAD_TRIM = True
+VAD_THRESHOLD_DB = -45.0     # Frame RMS (dBFS) above this counts as voice
+VAD_FRAME_MS = 30            # Analysis window
+VAD_PAD_MS = 200             # Kept around the voiced region so word edges survive
+
+# Lip sync envelope returned with synthesized speech
+LIPSYNC_FPS = 30             # Envelope frames per second of audio; the client interpolates
+LIPSYNC_FLOOR_DB = -45.0     # Frame RMS at or below this -> mouth closed
+LIPSYNC_CEIL_DB = -15.0      # At or above this -> fully open
+LIPSYNC_VISEMES = True       # Also split the opening into VRM aa / ih / ou by band energy
+
+# Band (Hz) whose energy drives each VRM viseme
+VISEME_BANDS = {
+    "ou": (80, 700),         # Rounded, low second formant
+    "aa": (700, 1800),       # Open
+    "ih": (1800, 4000),      # Spread, high second formant
+}
+
+
+### Decoding ###
+
+def _is_wav(data: bytes) -> bool:
+    return data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+
+def _pcm_to_float(raw: bytes, sample_width: int) -> np.ndarray:
+    """Integer PCM bytes -> float32 in [-1, 1]."""
+    if sample_width == 1:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if sample_width == 2:
+        return np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    if sample_width == 4:
+        return np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    raise wave.Error(f"unsupported sample width {sample_width}")
+
+
+def _decode_wav(data: bytes) -> np.ndarray:
+    """
+    PCM WAV fast path, no ffmpeg involved. 16 kHz only: other rates need a
+    low-pass filter before decimating, so they go to PyAV's resampler.
+    """
+    with wave.open(io.BytesIO(data), "rb") as wf:
+        channels = wf.getnchannels()
+        sample_width = wf.getsampwidth()
+        sample_rate = wf.getframerate()
+        if sample_rate != STT_SAMPLE_RATE:
+            raise wave.Error(f"{sample_rate} Hz needs resampling")
+        raw = wf.readframes(wf.getnframes())
+
+    samples = _pcm_to_float(raw, sample_width)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def decode_audio(data: bytes) -> np.ndarray:
+    """
+    Decodes an upload to float32 mono at 16 kHz.
+    16 kHz PCM WAV is parsed directly; anything else (browser webm/ogg from
+    MediaRecorder, float WAV, other sample rates, ...) goes through PyAV
+    from memory, whose resampler filters before decimating.
+    Format is sniffed from the bytes, not the filename — the client labels
+    its webm recordings as .wav.
+    """
+    if _is_wav(data):
+        try:
+            return _decode_wav(data)
+        except (wave.Error, EOFError, ValueError):
+            pass    # e.g. IEEE float or 44.1 kHz WAV, let PyAV handle it
+    return _decode_with_av(io.BytesIO(data), sampling_rate=STT_SAMPLE_RATE)
+
+
+### Voice-activity trim ###
+
+def trim_silence(samples: np.ndarray, sample_rate: int = STT_SAMPLE_RATE) -> np.ndarray:
+    """
+    Cuts leading and trailing silence using per-frame RMS energy.
+    Returns an empty array if no frame crosses the threshold.
+    """
+    frame = int(sample_rate * VAD_FRAME_MS / 1000)
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return samples
+
+    frames = samples[:n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    voiced = np.flatnonzero(20.0 * np.log10(rms + 1e-10) > VAD_THRESHOLD_DB)
+    if len(voiced) == 0:
+        return samples[:0]
+
+    pad = int(sample_rate * VAD_PAD_MS / 1000)
+    start = max(0, voiced[0] * frame - pad)
+    end = min(len(samples), (voiced[-1] + 1) * frame + pad)
+    return samples[start:end]
+
+
+def load_stt_audio(data: bytes) -> np.ndarray:
+    """Upload bytes -> trimmed float32 16 kHz buffer, ready for stt_model.transcribe."""
+    samples = decode_audio(data)
+    if VAD_TRIM:
+        samples = trim_silence(samples)
+    return samples
+
+
+### Encoding ###
+
+# name -> (media type, libsndfile format, subtype)
+AUDIO_FORMATS = {
+    "wav":  ("audio/wav", None, None),
+    "flac": ("audio/flac", "FLAC", "PCM_16"),    # Lossless, about half of WAV
+    "opus": ("audio/ogg", "OGG", "OPUS"),        # Lossy, about a tenth of WAV
+}
+
+
+def available_formats() -> list:
+    """Formats this install can encode."""
+    formats = ["wav"]
+    if soundfile is not None:
+        formats += [name for name, (_, fmt, subtype) in AUDIO_FORMATS.items()
+                    if fmt and soundfile.check_format(fmt, subtype)]
+    return formats
+
+
+def to_int16(samples: np.ndarray) -> np.ndarray:
+    """Float [-1, 1] -> int16 PCM, clipped. One float32 scratch buffer, input untouched (may be cached)."""
+    scaled = np.multiply(samples, 32767.0, dtype=np.float32)
+    np.clip(scaled, -32767.0, 32767.0, out=scaled)
+    return scaled.astype("<i2", copy=False)
+
+
+def encode_audio(samples: np.ndarray, sample_rate: int, audio_format: str = "wav") -> bytes:
+    """Encodes mono float samples as `audio_format` (see AUDIO_FORMATS)."""
+    pcm = to_int16(samples)
+    buffer = io.BytesIO()
+    _, fmt, subtype = AUDIO_FORMATS[audio_format]
+    if fmt is None:
+        with wave.open(buffer, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes(pcm.tobytes())
+    else:
+        soundfile.write(buffer, pcm, sample_rate, format=fmt, subtype=subtype)
+    return buffer.getvalue()
+
+
+### Lip sync ###
+
+def lipsync_envelope(samples: np.ndarray, sample_rate: int) -> dict:
+    """
+    Mouth-open timeline for `samples`: RMS per 1/LIPSYNC_FPS window, mapped
+    from dBFS to [0, 1]. With LIPSYNC_VISEMES, the opening is split into
+    aa / ih / ou in proportion to each band's share of the window's energy.
+    Returns {"fps": .., "open": [...], "visemes": {"aa": [...], ...}}.
+    """
+    window = max(1, sample_rate // LIPSYNC_FPS)
+    n_frames = -(-len(samples) // window)     # Last partial window counts too
+    if n_frames == 0:
+        return {"fps": LIPSYNC_FPS, "open": []}
+
+    frames = np.zeros(n_frames * window, dtype=np.float32)
+    frames[:len(samples)] = samples
+    frames = frames.reshape(n_frames, window)
+
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    db = 20.0 * np.log10(rms + 1e-10)
+    mouth_open = np.clip((db - LIPSYNC_FLOOR_DB) / (LIPSYNC_CEIL_DB - LIPSYNC_FLOOR_DB), 0.0, 1.0)
+    envelope = {"fps": LIPSYNC_FPS, "open": np.round(mouth_open, 2).tolist()}
+
+    if LIPSYNC_VISEMES:
+        power = np.square(np.abs(np.fft.rfft(frames * np.hanning(window).astype(np.float32), axis=1)))
+        freqs = np.fft.rfftfreq(window, 1.0 / sample_rate)
+        energies = np.stack([power[:, (freqs >= low) & (freqs < high)].sum(axis=1)
+                             for low, high in VISEME_BANDS.values()])
+        shares = energies / (energies.sum(axis=0) + 1e-10)
+        envelope["visemes"] = {
+            name: np.round(mouth_open * share, 2).tolist() for name, share in zip(VISEME_BANDS, shares)
+        }
+    return envelope
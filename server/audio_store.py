@@ -0,0 +1,84 @@
+### Audio Store ###
+# Synthesized clips live in memory until the client has fetched them.
+# Replaces writing static/*.wav per turn and sweeping the folder every request:
+# ids are random (no same-second collisions) and clips expire on their own.
+# A clip can be stored while it is still being encoded (a Future), so its
+# URL goes out without waiting for the encoder.
+
+### Imports ###
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+### Config ###
+AUDIO_TTL = 5 * 60                   # Seconds a clip stays fetchable
+AUDIO_MAX_BYTES = 64 * 1024 * 1024   # Oldest clips go first past this
+
+
+class AudioStore:
+    """Thread-safe id -> (bytes, media type) map with TTL and size-based eviction."""
+
+    def __init__(self, ttl: float = AUDIO_TTL, max_bytes: int = AUDIO_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clips = OrderedDict()     # id -> (data, media_type, expires_at), oldest first
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, data: bytes | Future, media_type: str) -> str:
+        """Stores a clip (bytes, or a Future that resolves to bytes) and returns its id."""
+        audio_id = uuid.uuid4().hex
+        with self._lock:
+            self._evict(time.monotonic())
+            self.clips[audio_id] = (data, media_type, time.monotonic() + self.ttl)
+        if isinstance(data, Future):
+            data.add_done_callback(lambda future: self._resolve(audio_id, future))
+        else:
+            self._count(len(data))
+        return audio_id
+
+    def _resolve(self, audio_id: str, future: Future):
+        """Swaps a finished encode in for its Future. Failed encodes stay a Future (the endpoint reports them)."""
+        if future.exception() is not None:
+            return
+        data = future.result()
+        with self._lock:
+            clip = self.clips.get(audio_id)
+            if clip is None:
+                return
+            self.clips[audio_id] = (data, clip[1], clip[2])
+        self._count(len(data))
+
+    def _count(self, size: int):
+        with self._lock:
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and len(self.clips) > 1:
+                self._drop(next(iter(self.clips)))
+
+    def get(self, audio_id: str):
+        """Returns (data, media_type), or None if unknown or expired. data may still be a Future."""
+        with self._lock:
+            clip = self.clips.get(audio_id)
+            if clip is None or clip[2] < time.monotonic():
+                return None
+            return clip[0], clip[1]
+
+    def _drop(self, audio_id: str):
+        data, _, _ = self.clips.pop(audio_id)
+        if not isinstance(data, Future):
+            self.total_bytes -= len(data)
+
+    def _evict(self, now: float):
+        """Drops expired clips. All share one TTL, so they expire oldest first. Caller holds _lock."""
+        while self.clips:
+            audio_id, (_, _, expires_at) = next(iter(self.clips.items()))
+            if expires_at >= now:
+                break
+            self._drop(audio_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"clips": len(self.clips), "bytes": self.total_bytes}
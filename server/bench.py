@@ -0,0 +1,320 @@
+### Benchmark ###
+# Per-stage timings of a full turn (STT upload -> /chat -> recorded turn),
+# driven through main.py's endpoints. Uses the fakes from fakes.py
+# (configurable latency and output size) unless --real is given, and
+# sweeps history length to show how prompt assembly and persistence scale.
+# Prints per-stage p50/p99 as JSON on stdout; server logs go to stderr.
+#   python bench.py --history 0,200,2000 --turns 20 --output bench.json
+#   python bench.py --baseline bench.json      # exit 1 on a p50 regression
+#   python bench.py --stt-load 1,4,8,16        # /transcribe throughput vs latency, batched and not
+
+### Imports ###
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+import types
+import wave
+from pathlib import Path
+import numpy as np
+import fakes
+import metrics
+import stt_batcher
+
+
+### Config ###
+DEFAULT_HISTORY = "0,100,1000"     # Raw turns already in history, per sweep step
+DEFAULT_TURNS = 10                 # Measured turns per step
+UPLOAD_SECONDS = 3.0               # Length of the fake push-to-talk clip
+DEFAULT_STT_REQUESTS = 8           # --stt-load: requests per concurrent client
+TOLERANCE = 0.25                   # --baseline: p50 this much slower counts as a regression
+MIN_REGRESSION_MS = 1.0            # ...and by at least this much (ignores sub-ms jitter)
+
+
+def install_fake_modules():
+    """Lets main.py import without llama_cpp / faster_whisper / kokoro_onnx installed."""
+    fake_modules = {
+        "llama_cpp": {"Llama": fakes.FakeLlama},
+        "faster_whisper": {"WhisperModel": fakes.FakeWhisper, "BatchedInferencePipeline": fakes.FakeBatchedPipeline},
+        "kokoro_onnx": {"Kokoro": fakes.FakeKokoro},
+    }
+    for name, attrs in fake_modules.items():
+        try:
+            __import__(name)
+        except ImportError:
+            module = types.ModuleType(name)
+            module.__dict__.update(attrs)
+            sys.modules[name] = module
+
+    # The real decoder when faster-whisper is there; the bench only sends 16 kHz PCM WAV, which never needs it
+    if "faster_whisper.audio" not in sys.modules:
+        try:
+            __import__("faster_whisper.audio")
+        except ImportError:
+            def decode_audio(*args, **kwargs):
+                raise RuntimeError("Decoding anything but 16 kHz PCM WAV needs faster-whisper (PyAV) installed")
+            audio = types.ModuleType("faster_whisper.audio")
+            audio.decode_audio = decode_audio
+            sys.modules["faster_whisper.audio"] = audio
+            sys.modules["faster_whisper"].audio = audio
+
+
+class StageRecorder:
+    """metrics exporter collecting every span duration by stage name."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def __call__(self, kind: str, name: str, seconds: float):
+        if kind == "span":
+            self.samples.setdefault(name, []).append(seconds)
+
+    def summary(self) -> dict:
+        result = {}
+        for name, values in sorted(self.samples.items()):
+            ms = np.array(values) * 1000
+            result[name] = {
+                "count": len(values),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p99_ms": round(float(np.percentile(ms, 99)), 3),
+                "mean_ms": round(float(ms.mean()), 3),
+            }
+        return result
+
+
+def speech_wav(seconds: float, sample_rate: int = 16000) -> bytes:
+    """Noise bursts shaped like syllables, so VAD trimming has something to keep."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = np.clip(np.sin(2 * np.pi * 3.0 * t), 0, None)
+    samples = 0.3 * envelope * np.random.default_rng(0).standard_normal(len(t))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def setup(args, work_dir: Path):
+    """Imports main and points it at fakes (or real models) and a throwaway log dir."""
+    install_fake_modules()
+    import main
+    import memory
+    from prompt_cache import PrefixCache
+    from sessions import SessionManager
+    from tts_cache import TTSCache
+
+    main.MEMORY_PATH = work_dir / "logs" / "chat_log.json"
+    if not main.CONFIG_PATH.exists():
+        main.CONFIG_PATH = work_dir / "vesi_config.yaml"
+        main.CONFIG_PATH.write_text("system_prompt: You are Vesi, a smug tsundere.\nuser_facts: []\n")
+
+    # RAM-only caches, so the bench leaves ../cache alone; the TTS cache would hide Kokoro time
+    main.prefix_cache = PrefixCache() if main.USE_PREFIX_CACHE else None
+    main.tts_cache = TTSCache() if args.tts_cache else None
+    main.WARMUP = True
+
+    if args.real:
+        main.init_models()
+        failed = [name for name, status in main.model_status.items() if status["state"] != "ready"]
+        if failed:
+            sys.exit(f"Could not load real models: {', '.join(failed)}")
+    else:
+        main.llm = fakes.FakeLlama(
+            reply=" ".join([fakes.DEFAULT_REPLY] * args.reply_repeat),
+            prefill_latency=args.prefill_latency, token_latency=args.token_latency,
+        )
+        main.stt_model = fakes.FakeWhisper(latency_per_second=args.stt_latency, batch_latency=args.stt_batch_latency)
+        main.stt_batched = fakes.FakeBatchedPipeline(main.stt_model)
+        main.vocal_cord = fakes.FakeKokoro(latency_per_char=args.tts_latency)
+        for status in main.model_status.values():
+            status["state"] = "ready"
+        main.sessions = SessionManager(main.MEMORY_PATH.parent, main.MEMORY_PATH, main.load_memory)
+
+    # Compression is measured once per step, not fired by the measured turns
+    memory.COMPRESSION_THRESHOLD = 10 ** 9
+    return main
+
+
+def seed_history(main, session, n_turns: int):
+    """Appends `n_turns` raw turns of typical length and snapshots them."""
+    with session.lock:
+        for i in range(n_turns):
+            role = "user" if i % 2 == 0 else "assistant"
+            session.history.append({"role": role, "content": f"Turn {i}: " + fakes.DEFAULT_REPLY})
+        session.store.write_snapshot(session.history)
+
+
+async def wait_for_encodes(main):
+    while main.scheduler.stats()["encode"]["depth"]:
+        await asyncio.sleep(0.005)
+
+
+async def run_step(main, args, n_history: int, upload: bytes) -> dict:
+    from fastapi import UploadFile
+
+    session_id = f"bench_{n_history}"
+    session = main.sessions.acquire(session_id)
+    seed_history(main, session, n_history)
+    main.sessions.release(session)
+
+    recorder = StageRecorder()
+    metrics.add_exporter(recorder)
+    try:
+        for i in range(args.turns):
+            turn_start = time.perf_counter()
+            await main.transcribe_audio(UploadFile(io.BytesIO(upload), filename="bench.wav"))
+            request = main.ChatRequest(message=f"Tell me something, turn {i}.", session_id=session_id)
+            if args.stream:
+                response = await main.chat_stream(request)
+                async for _ in response.body_iterator:
+                    pass
+            else:
+                await main.chat(request)
+            await wait_for_encodes(main)
+            recorder("span", "turn", time.perf_counter() - turn_start)
+
+        # One compression of everything but the recent turns
+        session.compression_lock.acquire()
+        await asyncio.to_thread(main.run_compression, session)
+    finally:
+        metrics.remove_exporter(recorder)
+    return recorder.summary()
+
+
+async def run_stt_load(main, args, upload: bytes) -> dict:
+    """
+    Closed-loop /transcribe load: `concurrency` clients each send
+    --stt-requests clips back to back, with and without micro-batching.
+    Returns throughput and per-request latency per mode and concurrency.
+    """
+    from fastapi import UploadFile
+
+    if main.stt_batcher is None:
+        sys.exit("--stt-load needs STT_BATCHING = True in main.py")
+    configured = main.stt_batcher
+    batched = stt_batcher.STTBatcher(configured.run_single, configured.run_batch, args.stt_batch, args.stt_wait / 1000)
+    # Room for every client (twice: a finished job counts until its worker moves on),
+    # so unbatched runs measure queueing instead of 503s
+    stt_queue = main.scheduler.queues["stt"]
+    queue_limit = stt_queue.max_depth
+    stt_queue.max_depth = max(queue_limit, 2 * max(args.stt_load))
+    results = {}
+    try:
+        for mode, batcher in (("unbatched", None), ("batched", batched)):
+            main.stt_batcher = batcher
+            results[mode] = {}
+            for concurrency in args.stt_load:
+                print(f"--- Bench: /transcribe {mode}, {concurrency} clients ---", file=sys.stderr)
+                latencies = []
+
+                async def client():
+                    for _ in range(args.stt_requests):
+                        request_start = time.perf_counter()
+                        await main.transcribe_audio(UploadFile(io.BytesIO(upload), filename="load.wav"))
+                        latencies.append(time.perf_counter() - request_start)
+
+                start = time.perf_counter()
+                await asyncio.gather(*(client() for _ in range(concurrency)))
+                elapsed = time.perf_counter() - start
+
+                ms = np.array(latencies) * 1000
+                results[mode][str(concurrency)] = {
+                    "requests": len(latencies),
+                    "throughput_rps": round(len(latencies) / elapsed, 2),
+                    "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                    "p99_ms": round(float(np.percentile(ms, 99)), 3),
+                }
+            if batcher:
+                results[mode]["batching"] = batcher.stats()
+    finally:
+        main.stt_batcher = configured
+        stt_queue.max_depth = queue_limit
+    return results
+
+
+async def run(args, work_dir: Path) -> dict:
+    main = setup(args, work_dir)
+    upload = speech_wav(UPLOAD_SECONDS)
+    if args.stt_load:
+        return {
+            "mode": "real" if args.real else "fake",
+            "endpoint": "/transcribe",
+            "clip_seconds": UPLOAD_SECONDS,
+            "max_batch": args.stt_batch,
+            "max_wait_ms": args.stt_wait,
+            "stt_load": await run_stt_load(main, args, upload),
+        }
+    results = {
+        "mode": "real" if args.real else "fake",
+        "endpoint": "/chat/stream" if args.stream else "/chat",
+        "turns": args.turns,
+        "history": {},
+    }
+    for n_history in args.history:
+        print(f"--- Bench: {n_history} turns of history ---", file=sys.stderr)
+        results["history"][str(n_history)] = await run_step(main, args, n_history, upload)
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """Stages whose p50 got slower than the baseline's by more than `tolerance`."""
+    regressions = []
+    for n_history, stages in results.get("history", {}).items():
+        for name, stats in stages.items():
+            before = baseline.get("history", {}).get(n_history, {}).get(name)
+            if not before:
+                continue
+            slower_ms = stats["p50_ms"] - before["p50_ms"]
+            if slower_ms > MIN_REGRESSION_MS and stats["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+                regressions.append(f"{name} @ {n_history} history: p50 {before['p50_ms']} -> {stats['p50_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage benchmark of a Vesi turn")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="comma-separated history lengths (raw turns)")
+    parser.add_argument("--turns", type=int, default=DEFAULT_TURNS, help="measured turns per history length")
+    parser.add_argument("--stream", action="store_true", help="drive /chat/stream instead of /chat")
+    parser.add_argument("--real", action="store_true", help="load the real models from main.py's config")
+    parser.add_argument("--tts-cache", action="store_true", help="keep the TTS cache on")
+    parser.add_argument("--token-latency", type=float, default=0.03, help="fake LLM seconds per generated token")
+    parser.add_argument("--prefill-latency", type=float, default=0.0002, help="fake LLM seconds per prompt token")
+    parser.add_argument("--reply-repeat", type=int, default=1, help="fake reply length, in copies of the default reply")
+    parser.add_argument("--stt-latency", type=float, default=0.01, help="fake Whisper seconds per audio second")
+    parser.add_argument("--tts-latency", type=float, default=0.004, help="fake Kokoro seconds per character")
+    parser.add_argument("--stt-load", help="comma-separated client counts: run the /transcribe load test instead")
+    parser.add_argument("--stt-requests", type=int, default=DEFAULT_STT_REQUESTS, help="--stt-load requests per client")
+    parser.add_argument("--stt-batch", type=int, default=stt_batcher.MAX_BATCH, help="--stt-load max clips per batch")
+    parser.add_argument("--stt-wait", type=float, default=stt_batcher.MAX_WAIT * 1000, help="--stt-load max batch wait (ms)")
+    parser.add_argument("--stt-batch-latency", type=float, default=0.005, help="fake Whisper seconds per extra batch row")
+    parser.add_argument("--output", help="also write the JSON here")
+    parser.add_argument("--baseline", help="earlier --output to compare p50s against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+    args.history = [int(n) for n in args.history.split(",")]
+    args.stt_load = [int(n) for n in args.stt_load.split(",")] if args.stt_load else None
+
+    with tempfile.TemporaryDirectory(prefix="vesi_bench_") as work_dir:
+        with contextlib.redirect_stdout(sys.stderr):
+            results = asyncio.run(run(args, Path(work_dir)))
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+
+    if args.baseline:
+        regressions = find_regressions(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
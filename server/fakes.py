@@ -0,0 +1,227 @@
+### Model Stand-ins ###
+# Drop-in fakes for Llama, WhisperModel and Kokoro with configurable latency.
+# Lets the pipeline be exercised and timed without GPUs or model files:
+#   python fakes.py
+# (bench.py uses them for the per-stage benchmark)
+
+### Imports ###
+import re
+import time
+import zlib
+from types import SimpleNamespace
+import numpy as np
+
+
+DEFAULT_REPLY = (
+    "Hmph. You again, baka? I suppose I can spare a minute. "
+    "Don't get the wrong idea, I was just bored. "
+    "So what do you want this time?"
+)
+
+
+class FakeLlama:
+    """
+    Mimics the parts of llama_cpp.Llama that Vesi uses, including KV prefix reuse:
+    create_completion only "prefills" prompt tokens past the longest prefix shared
+    with the previous call, at `prefill_latency` per token, then sleeps
+    `token_latency` per generated token. Generated tokens are the
+    whitespace-preserving word pieces of `reply`.
+    """
+
+    def __init__(self, reply: str = DEFAULT_REPLY, prefill_latency: float = 0.0002, token_latency: float = 0.03):
+        self.reply = reply
+        self.prefill_latency = prefill_latency
+        self.token_latency = token_latency
+        self._input_ids = []
+        self.n_tokens = 0
+        self.prefilled_tokens = 0     # Total prompt tokens actually evaluated
+
+    # --- Tokenizer / KV state ---
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> list[int]:
+        # One fake token per word (with its trailing whitespace), so a prompt
+        # cut at a message boundary tokenizes to a prefix of the full prompt
+        return [1] * add_bos + [zlib.crc32(word) & 0xFFFF for word in re.findall(rb"\S+\s*|\s+", text)]
+
+    @property
+    def input_ids(self) -> list[int]:
+        # Like llama-cpp's n_ctx buffer: only the first n_tokens are valid, stale ones follow
+        return self._input_ids
+
+    def eval(self, tokens: list[int]):
+        time.sleep(self.prefill_latency * len(tokens))
+        self._input_ids[self.n_tokens:self.n_tokens + len(tokens)] = list(tokens)
+        self.n_tokens += len(tokens)
+        self.prefilled_tokens += len(tokens)
+
+    def save_state(self):
+        return (list(self._input_ids), self.n_tokens)
+
+    def load_state(self, state):
+        self._input_ids, self.n_tokens = list(state[0]), state[1]
+
+    # --- Generation ---
+
+    def _tokens(self) -> list[str]:
+        words = self.reply.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    def _prefill(self, prompt_tokens: list[int]):
+        common = 0
+        for a, b in zip(self.input_ids[:self.n_tokens], prompt_tokens):
+            if a != b:
+                break
+            common += 1
+        self.n_tokens = common
+        self.eval(prompt_tokens[common:])
+
+    def _generate(self, prompt_tokens: list[int], max_tokens: int):
+        self._prefill(prompt_tokens)
+        for token in self._tokens()[:max_tokens]:
+            time.sleep(self.token_latency)
+            yield token
+
+    def create_completion(self, prompt: str, stream=False, max_tokens=150, **kwargs):
+        prompt_tokens = self.tokenize(prompt.encode("utf-8"), special=True)
+        if stream:
+            return (
+                {"choices": [{"index": 0, "text": token, "finish_reason": None}]}
+                for token in self._generate(prompt_tokens, max_tokens)
+            )
+        tokens = list(self._generate(prompt_tokens, max_tokens))
+        return {
+            "choices": [{"index": 0, "text": "".join(tokens), "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt_tokens), "completion_tokens": len(tokens),
+                      "total_tokens": len(prompt_tokens) + len(tokens)},
+        }
+
+    def create_chat_completion(self, messages=None, stream=False, max_tokens=150, **kwargs):
+        prompt = "".join(f"{m['role']}: {m['content']}\n" for m in messages or [])
+        prompt_tokens = self.tokenize(prompt.encode("utf-8"))
+        if stream:
+            return (
+                {"choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                for token in self._generate(prompt_tokens, max_tokens)
+            )
+        text = "".join(self._generate(prompt_tokens, max_tokens))
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]}
+
+
+class FakeKokoro:
+    """
+    Mimics kokoro_onnx.Kokoro.create.
+    Takes `base_latency + latency_per_char * len(text)` and returns a quiet
+    sine of `seconds_per_char * len(text)` at `sample_rate`.
+    """
+
+    def __init__(self, base_latency: float = 0.05, latency_per_char: float = 0.004,
+                 seconds_per_char: float = 0.06, sample_rate: int = 24000):
+        self.base_latency = base_latency
+        self.latency_per_char = latency_per_char
+        self.seconds_per_char = seconds_per_char
+        self.sample_rate = sample_rate
+
+    def create(self, text, voice=None, speed=1.0, lang=None):
+        time.sleep(self.base_latency + self.latency_per_char * len(text))
+        n = int(self.sample_rate * self.seconds_per_char * len(text) / speed)
+        t = np.arange(n, dtype=np.float32) / self.sample_rate
+        return (0.2 * np.sin(2 * np.pi * 220.0 * t)).astype(np.float32), self.sample_rate
+
+
+class FakeWhisper:
+    """
+    Mimics faster_whisper.WhisperModel.transcribe.
+    Takes `base_latency + latency_per_second * audio seconds` (plus
+    `beam_latency` per extra beam) and returns `words_per_second` words
+    of filler text, one segment per `segment_seconds`.
+    """
+
+    def __init__(self, base_latency: float = 0.02, latency_per_second: float = 0.01,
+                 beam_latency: float = 0.002, words_per_second: float = 2.5,
+                 segment_seconds: float = 5.0, sample_rate: int = 16000, batch_latency: float = 0.005):
+        self.base_latency = base_latency
+        self.latency_per_second = latency_per_second
+        self.beam_latency = beam_latency
+        self.words_per_second = words_per_second
+        self.segment_seconds = segment_seconds
+        self.sample_rate = sample_rate
+        self.batch_latency = batch_latency      # Extra cost per additional batch row
+
+    def transcribe(self, audio, beam_size=5, **kwargs):
+        duration = len(audio) / self.sample_rate
+        time.sleep(self.base_latency + self.latency_per_second * duration + self.beam_latency * (beam_size - 1))
+
+        segments = []
+        start = 0.0
+        while start < duration:
+            end = min(start + self.segment_seconds, duration)
+            n_words = max(1, int((end - start) * self.words_per_second))
+            segments.append(SimpleNamespace(start=start, end=end, text=" " + " ".join(["hello"] * n_words)))
+            start = end
+        return iter(segments), SimpleNamespace(duration=duration, language="en")
+
+
+class FakeBatchedPipeline:
+    """
+    Mimics faster_whisper.BatchedInferencePipeline.transcribe (1.2.1) with
+    clip_timestamps in seconds, each clip its own batch row. Rows decode side
+    by side: one call takes the model's latency for the longest clip plus
+    `batch_latency` per extra clip, and yields one segment per clip, timed in
+    the concatenated audio.
+    """
+
+    def __init__(self, model: FakeWhisper):
+        self.model = model
+
+    def transcribe(self, audio, clip_timestamps=None, beam_size=5, **kwargs):
+        model = self.model
+        rate = model.sample_rate
+        clips = clip_timestamps or [{"start": 0.0, "end": len(audio) / rate}]
+        longest = max(clip["end"] - clip["start"] for clip in clips)
+        time.sleep(model.base_latency + model.latency_per_second * longest
+                   + model.beam_latency * (beam_size - 1) + model.batch_latency * (len(clips) - 1))
+
+        segments = []
+        for clip in clips:
+            # Same sample rounding as faster-whisper, so times land where the real ones do
+            start, end = int(clip["start"] * rate) / rate, int(clip["end"] * rate) / rate
+            n_words = max(1, int((end - start) * model.words_per_second))
+            segments.append(SimpleNamespace(start=start, end=end, text=" " + " ".join(["hello"] * n_words)))
+        return iter(segments), SimpleNamespace(duration=len(audio) / rate, language="en")
+
+
+def measure_time_to_first_audio(llm, tts) -> dict:
+    """
+    Times first audio for the sequential path (generate all, then synthesize)
+    against the sentence-pipelined path. Returns both in ms.
+    """
+    from speech_pipeline import SpeechPipeline
+
+    # Sequential: what /chat does
+    start = time.perf_counter()
+    text = llm.create_completion("")["choices"][0]["text"]
+    tts.create(text)
+    sequential_ms = (time.perf_counter() - start) * 1000
+
+    # Pipelined: what /chat/stream does
+    start = time.perf_counter()
+    first_audio_ms = None
+    pipeline = SpeechPipeline(lambda sentence, index: tts.create(sentence))
+    for chunk in llm.create_completion("", stream=True):
+        pipeline.feed(chunk["choices"][0]["text"])
+        for _ in pipeline.ready():
+            first_audio_ms = first_audio_ms or (time.perf_counter() - start) * 1000
+    pipeline.finish()
+    for _ in pipeline.drain():
+        first_audio_ms = first_audio_ms or (time.perf_counter() - start) * 1000
+    pipelined_total_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "sequential_first_audio_ms": round(sequential_ms),
+        "pipelined_first_audio_ms": round(first_audio_ms),
+        "pipelined_total_ms": round(pipelined_total_ms),
+    }
+
+
+if __name__ == "__main__":
+    print(measure_time_to_first_audio(FakeLlama(), FakeKokoro()))
@@ -0,0 +1,133 @@
+### History Store ###
+# Append-only persistence for chat history.
+# chat_log.json  = snapshot (same list format as before)
+# chat_log.jsonl = journal of changes made since the snapshot, one JSON record per line
+# Startup replays snapshot + journal. Compaction folds the journal into a new snapshot.
+# The journal's first line names the snapshot it extends (sha1), so a crash
+# between writing a snapshot and clearing the journal can't replay turns twice.
+
+### Imports ###
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+### Config ###
+COMPACT_EVERY = 200   # Journal records before the snapshot is rewritten
+
+
+class HistoryStore:
+    """
+    Persists a history list without rewriting it every turn.
+    Journal ops:
+      {"op": "base", "snapshot": sha1}   -> header, journal only applies on top of that snapshot
+      {"op": "append", "entry": {...}}   -> history.append(entry)
+      {"op": "system", "entry": {...}}   -> history[0] = entry
+    Anything that reshapes history (compression) goes through write_snapshot().
+    """
+
+    def __init__(self, snapshot_path: Path, compact_every: int = COMPACT_EVERY):
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = self.snapshot_path.with_suffix(".jsonl")
+        self.compact_every = compact_every
+        self.journal_records = 0
+        self.snapshot_digest = None     # sha1 of the snapshot file the journal extends
+        self.has_header = False
+
+    def exists(self) -> bool:
+        return self.snapshot_path.exists() or self.journal_path.exists()
+
+    def size_bytes(self) -> int:
+        """Snapshot plus journal on disk."""
+        return sum(path.stat().st_size for path in (self.snapshot_path, self.journal_path) if path.exists())
+
+    def load(self) -> list:
+        """
+        Replays snapshot + journal. A torn last journal line (crash mid-write)
+        is dropped and cut from the file, so the next append starts on a fresh line.
+        """
+        history = []
+        self.snapshot_digest = None
+        if self.snapshot_path.exists():
+            raw = self.snapshot_path.read_bytes()
+            self.snapshot_digest = hashlib.sha1(raw).hexdigest()
+            history = json.loads(raw)
+
+        self.journal_records = 0
+        self.has_header = False
+        if self.journal_path.exists():
+            raw = self.journal_path.read_bytes()
+            complete = raw.rfind(b"\n") + 1
+            if complete < len(raw):
+                print(f"--- Dropping torn journal record in {self.journal_path.name} ---")
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(complete)
+            records = []
+            for line in raw[:complete].splitlines():
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"--- Skipping torn journal record in {self.journal_path.name} ---")
+
+            if records and records[0].get("op") == "base" and records[0]["snapshot"] == self.snapshot_digest:
+                for record in records[1:]:
+                    self._apply(history, record)
+                self.journal_records = len(records) - 1
+                self.has_header = True
+            elif records:
+                # Journal belongs to an older snapshot that already contains it
+                print(f"--- Ignoring stale journal {self.journal_path.name} ---")
+                open(self.journal_path, "w", encoding="utf-8").close()
+        return history
+
+    @staticmethod
+    def _apply(history: list, record: dict):
+        if record["op"] == "append":
+            history.append(record["entry"])
+        elif record["op"] == "system":
+            if history:
+                history[0] = record["entry"]
+            else:
+                history.append(record["entry"])
+
+    def _write_journal(self, records: list):
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        lines = [json.dumps(r) + "\n" for r in records]
+        if not self.has_header:
+            lines.insert(0, json.dumps({"op": "base", "snapshot": self.snapshot_digest}) + "\n")
+            self.has_header = True
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+        self.journal_records += len(records)
+
+    def append(self, entries: list, history: list):
+        """
+        Journals `entries`, which the caller has already appended to `history`.
+        Compacts into a fresh snapshot once the journal gets long.
+        """
+        self._write_journal([{"op": "append", "entry": e} for e in entries])
+        if self.journal_records >= self.compact_every:
+            self.write_snapshot(history)
+
+    def set_system(self, entry: dict):
+        """Journals a replacement of the system prompt at history[0]."""
+        self._write_journal([{"op": "system", "entry": entry}])
+
+    def write_snapshot(self, history: list):
+        """Atomically rewrites the snapshot and starts a fresh journal on top of it."""
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        raw = json.dumps(history, indent=4).encode("utf-8")
+        tmp_path = self.snapshot_path.with_suffix(".json.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # Snapshot now covers everything; the old journal no longer matches its digest
+        self.snapshot_digest = hashlib.sha1(raw).hexdigest()
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"op": "base", "snapshot": self.snapshot_digest}) + "\n")
+        self.journal_records = 0
+        self.has_header = True
@@ -0,0 +1,94 @@
+### Leak Guard ###
+# Single source of truth for "Vesi stopped talking and became someone else":
+# chat template tokens and turn headers for the user or system. Matching is
+# case-insensitive and incremental, so generation can be cut the moment a
+# leak begins, even when its marker is split across several tokens.
+#   guard = LeakGuard()
+#   for delta in deltas:
+#       send(guard.feed(delta))     # Only text that cannot be the start of a leak
+#       if guard.leaked:
+#           break                   # Stop decoding
+#   send(guard.finish())
+
+### Imports ###
+import re
+
+
+### Config ###
+# Literal markers, matched case-insensitively. A "\n..." marker also matches
+# at the very start of the reply.
+LEAK_MARKERS = [
+    "<|im_end|>",
+    "<|im_start|>",
+    "<|eot_id|>",
+    "<|end_of_text|>",
+    "<user",
+    "<system",
+    "<|user",
+    "<|system",
+    "<|arskaz",
+    "\nUser:",
+    "\nArskaz:",
+    "\nSystem:",
+]
+
+LEAK_RE = re.compile("|".join(re.escape(marker) for marker in LEAK_MARKERS), re.IGNORECASE)
+MAX_MARKER_CHARS = max(len(marker) for marker in LEAK_MARKERS)
+
+# Every proper prefix of every marker, lowercased: a reply ending in one of
+# these might be the start of a leak, so it is held back until it is not
+_MARKER_PREFIXES = {marker.lower()[:i] for marker in LEAK_MARKERS for i in range(1, len(marker))}
+
+# llama.cpp stop strings: exact-case, so only a backstop; the guard is what cuts
+STOP_SEQUENCES = LEAK_MARKERS + ["\nuser:", "\narskaz:", "\nsystem:", "<|User", "<User"]
+
+
+class LeakGuard:
+    """Incremental leak matcher over streamed text deltas."""
+
+    def __init__(self):
+        self._text = "\n"       # Sentinel, so "\nUser:" also matches at the start
+        self._released = 1      # Offset into _text already returned by feed()
+        self._cut = None        # Offset into _text where the leak begins
+
+    @property
+    def leaked(self) -> bool:
+        return self._cut is not None
+
+    @property
+    def text(self) -> str:
+        """The reply so far, up to any leak (including text still held back)."""
+        return self._text[1:self._cut]
+
+    def feed(self, delta: str) -> str:
+        """Adds a delta and returns the newly safe text. Returns "" once leaked."""
+        if self._cut is not None:
+            return ""
+        # A match can only start in the last MAX_MARKER_CHARS - 1 old chars or the delta
+        scan_from = max(len(self._text) - MAX_MARKER_CHARS + 1, 0)
+        self._text += delta
+
+        match = LEAK_RE.search(self._text, scan_from)
+        if match:
+            self._cut = match.start()
+            end = self._cut
+        else:
+            end = len(self._text) - self._held_back()
+        return self._release(end)
+
+    def finish(self) -> str:
+        """Generation ended without a leak completing: the held-back tail is plain text."""
+        return self._release(len(self._text) if self._cut is None else self._cut)
+
+    def _held_back(self) -> int:
+        """Length of the longest suffix that could still grow into a marker."""
+        for size in range(min(MAX_MARKER_CHARS - 1, len(self._text)), 0, -1):
+            if self._text[-size:].lower() in _MARKER_PREFIXES:
+                return size
+        return 0
+
+    def _release(self, end: int) -> str:
+        end = max(end, self._released)
+        released = self._text[self._released:end]
+        self._released = end
+        return released
@@ -1,35 +1,79 @@
 ### Imports ###
-import os
+import asyncio
+import threading
+from concurrent.futures import Future
 import json
 import re
-import wave
 import time
-import tempfile
 import numpy as np
 import uvicorn
 import yaml
 from pathlib import Path
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import UploadFile, File
 from pydantic import BaseModel
 from llama_cpp import Llama
-from faster_whisper import WhisperModel
+from faster_whisper import WhisperModel, BatchedInferencePipeline
 from kokoro_onnx import Kokoro
-from mood_system import calculate_mood, get_temperature, get_emotion, get_tts_speed
-from memory import should_compress, compress, build_messages
+from mood_system import configure_mood, score_turn, get_temperature, get_emotion, get_tts_speed
+from memory import should_compress, get_compressible_turns, summarize_turns, merge_compressed, build_messages, stable_prefix_length
+from memory import get_foldable_blocks, summarize_blocks, merge_folded, compressed_blocks, set_tokenizer, MEMORY_PINNED, MEMORY_RECALL_K
 from tools import get_passive_context, run_active_tools
+from speech_pipeline import SpeechPipeline
+from scheduler import InferenceScheduler, QueueFullError, BACKGROUND
+from history_store import HistoryStore
+from prompt_cache import PrefixCache, render_chatml, render_chatml_open
+from audio_io import load_stt_audio, encode_audio, available_formats, lipsync_envelope, AUDIO_FORMATS, STT_SAMPLE_RATE
+from stt_stream import StreamingTranscriber, PARTIAL_INTERVAL
+from stt_batcher import STTBatcher
+from sessions import SessionManager, Session, DEFAULT_SESSION
+from tts_cache import TTSCache
+from speculation import Speculator
+from turns import TurnRegistry, TurnCancelled, CancelToken, until_cancelled, unless_cancelled
+from leak_guard import LeakGuard, STOP_SEQUENCES
+from metrics import span, record, observe, enabled as metrics_enabled, add_exporter, format_gauge, PrometheusExporter
+from audio_store import AudioStore
 
 
 ### Config and Paths ###
 MODEL_PATH = r"D:/models/lumi_vesi_v2.0_q6k.gguf"
 MEMORY_PATH = Path("../logs/chat_log.json")
 CONFIG_PATH = Path("vesi_config.yaml")
-STATIC_DIR = "static"
+AUDIO_URL = "http://localhost:8000/audio"    # Where the client fetches synthesized clips
 
-if not os.path.exists(STATIC_DIR):
-    os.makedirs(STATIC_DIR)
+# KV state of the stable prompt prefix is kept in RAM and, if set, on disk across restarts.
+# Set USE_PREFIX_CACHE = False to always prefill the full prompt.
+USE_PREFIX_CACHE = True
+PREFIX_CACHE_DIR = Path("../cache/prompt")
+
+# Synthesized speech is reused for repeated text (same voice and speed bucket).
+# Set TTS_CACHE_DIR = None to keep the cache in RAM only.
+USE_TTS_CACHE = True
+TTS_CACHE_DIR = Path("../cache/tts")
+
+# Models load in parallel in the background while the server already accepts
+# connections; WARMUP runs one tiny job through each before it counts as ready.
+WARMUP = True
+
+# Max queued + running jobs per model worker before /chat and /transcribe answer 503.
+# TTS is higher since /chat/stream queues one job per sentence; encode follows TTS.
+QUEUE_LIMITS = {"llm": 4, "stt": 8, "tts": 32, "encode": 64}
+
+# Prefill the next prompt into the KV cache while the user is idle, typing or
+# still speaking (drafts via /chat/draft and streaming STT), see speculation.py.
+SPECULATIVE_PREFILL = True
+
+# Decode /transcribe requests that arrive together as one Whisper batch, see
+# stt_batcher.py for batch size and wait. Clips longer than one Whisper
+# window always go alone.
+STT_BATCHING = True
+STT_BATCH_MAX_SECONDS = 30
+
+# Serve /metrics in Prometheus text format. With METRICS = False no exporter
+# is attached and the timing spans cost next to nothing.
+METRICS = True
 
 app = FastAPI()
 
@@ -41,17 +85,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
-
 ### Globals ###
 llm = None
 stt_model = None
+stt_batched = None  # BatchedInferencePipeline over stt_model
 vocal_cord = None
-vesi_mood_score = 50
-history = []
+scheduler = InferenceScheduler(QUEUE_LIMITS)
+prefix_cache = PrefixCache(PREFIX_CACHE_DIR) if USE_PREFIX_CACHE else None
+tts_cache = TTSCache(TTS_CACHE_DIR) if USE_TTS_CACHE else None
+audio_store = AudioStore()
+turns = TurnRegistry()
+speculator = Speculator() if SPECULATIVE_PREFILL else None
+# Batches run as one job on the STT worker, waiting for room rather than failing
+stt_batcher = STTBatcher(
+    lambda audio: scheduler.submit("stt", transcribe, audio, block=True).result(),
+    lambda audios: scheduler.submit("stt", transcribe_batch, audios, block=True).result(),
+) if STT_BATCHING else None
+sessions = None     # SessionManager, created in init_models
+prometheus = PrometheusExporter() if METRICS else None
+if prometheus:
+    add_exporter(prometheus)
+
+# Per-model load state for /health and /ready: "pending" -> "loading" -> "warming" -> "ready" | "failed"
+model_status = {name: {"state": "pending"} for name in ("stt", "tts", "llm")}
 
 class ChatRequest(BaseModel):
     message: str
+    session_id: str = DEFAULT_SESSION
+    audio_format: str = "wav"    # "wav", "flac" or "opus"; falls back to wav if unavailable
+    request_id: str | None = None    # For /chat/cancel; generated if missing
+
+class DraftRequest(BaseModel):
+    text: str = ""    # The next message so far
+    session_id: str = DEFAULT_SESSION
+
+class CancelRequest(BaseModel):
+    request_id: str | None = None    # Cancel this turn...
+    session_id: str | None = None    # ...or whatever turn is running in this session
 
 class RememberRequest(BaseModel):
     fact: str
@@ -82,64 +152,30 @@ def build_system_prompt(config: dict) -> str:
 
 ### Helper functions ###
 
-# Patterns that signal Vesi stopped talking and "became" the user or system
-_ROLE_LEAK_PATTERNS = [
-    r"<\|im_end\|>",
-    r"<\|im_start\|>",
-    r"<\|eot_id\|>",
-    r"<\|end_of_text\|>",
-    r"<user",              
-    r"<system",            
-    r"<\|user",
-    r"<\|User",
-    r"<\|system",          
-    r"<\|arskaz",
-    r"\nUser:",
-    r"\nuser:",
-    r"\nArskaz:",
-    r"\narskaz:",
-    r"\nSystem:",
-    r"\nsystem:",
-]
-
-_ROLE_LEAK_RE = re.compile("|".join(_ROLE_LEAK_PATTERNS), re.IGNORECASE)
-
-def clean_response(text: str) -> str:
-    """Strip everything from the first role-leak pattern onward."""
-    match = _ROLE_LEAK_RE.search(text)
-    if match:
-        text = text[:match.start()]
-    return text.strip()
-    
-
-def load_memory() -> list:
+def load_memory(history_store: HistoryStore) -> list:
     """
-    Loads history from file or creates it if missing.
+    Replays a session's history from its snapshot + journal or creates it if missing.
     Always overwrites history[0] with the current YAML config.
     YAML is always the source of truth for the system prompt.
     """
-    MEMORY_PATH.parent.mkdir(parents=True, exist_ok=True)
-
     config = load_config()
     system_prompt_content = build_system_prompt(config)
     system_message = {"role": "system", "content": system_prompt_content}
 
-    if MEMORY_PATH.exists():
+    if history_store.exists():
         try:
-            with open(MEMORY_PATH, "r", encoding="utf-8") as f:
-                loaded = json.load(f)
-            
+            loaded = history_store.load()
+
             # Always overwrite index 0 with fresh config — YAML wins
             if loaded and loaded[0].get("role") == "system":
-                loaded[0] = system_message
+                if loaded[0]["content"] != system_prompt_content:
+                    loaded[0] = system_message
+                    history_store.set_system(system_message)
             else:
                 loaded.insert(0, system_message)
-            
-            # Save back immediately so JSON stays in sync
-            with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-                json.dump(loaded, f, indent=4)
+                history_store.write_snapshot(loaded)
 
-            print(f"--- Memory loaded from {MEMORY_PATH.resolve()} ---")
+            print(f"--- Memory loaded from {history_store.snapshot_path.resolve()} ---")
             print(f"--- System prompt updated from vesi_config.yaml ---")
             return loaded
 
@@ -148,72 +184,834 @@ def load_memory() -> list:
 
     # Fresh start
     initial_history = [system_message]
-    with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-        json.dump(initial_history, f, indent=4)
-    print(f"--- Created new memory file at: {MEMORY_PATH.resolve()} ---")
+    history_store.write_snapshot(initial_history)
+    print(f"--- Created new memory file at: {history_store.snapshot_path.resolve()} ---")
     return initial_history
-        
 
-def save_memory(history_data):
-    """Saves history to memory json"""
-    with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-        json.dump(history_data, f, indent=4)
 
+### Model initialization ###
 
-### Model initialization ### 
-def init_models():
-    """Starts all the models"""
-    global llm, stt_model, vocal_cord, history
-    print("--- Initializing Vesi ---")
-    # STT
+def load_stt():
+    global stt_model, stt_batched
     stt_model = WhisperModel("base", device="cuda", compute_type="float16")
+    stt_batched = BatchedInferencePipeline(model=stt_model)
     print("--- Faster Whisper Ready ---")
-    # TTS
+    if WARMUP:
+        model_status["stt"]["state"] = "warming"
+        transcribe(np.zeros(STT_SAMPLE_RATE, dtype=np.float32))    # One second of silence
+
+
+def load_tts():
+    global vocal_cord
     # See --> README_Voices.md for info
     vocal_cord = Kokoro("voices/kokoro-v0_19.onnx", "voices/voices-v1.0.bin")
     print("--- Kokoro Ready ---")
-    # LLM
+    if WARMUP:
+        model_status["tts"]["state"] = "warming"
+        vocal_cord.create("Hmph.", voice="af_bella", speed=1.0, lang="en-us")    # Not cached on purpose
+
+
+def load_llm():
+    global llm
     llm = Llama(model_path=MODEL_PATH, chat_format="chatml", n_ctx=12288, n_gpu_layers=-1, verbose=False)
     print("--- LLM Ready ---")
-    history = load_memory()
-    print("--- Vesi is Online ---")
+    if WARMUP:
+        model_status["llm"]["state"] = "warming"
+        llm.create_completion(render_chatml([{"role": "user", "content": "Hi"}]), max_tokens=1)
+
+
+MODEL_LOADERS = {"stt": load_stt, "tts": load_tts, "llm": load_llm}
+
+
+def load_model(name: str):
+    """Runs one loader, tracking its state and load time in model_status."""
+    status = model_status[name]
+    status["state"] = "loading"
+    start = time.perf_counter()
+    try:
+        MODEL_LOADERS[name]()
+        status["state"] = "ready"
+    except Exception as e:
+        status["state"] = "failed"
+        status["error"] = str(e)
+        print(f"--- Loading {name} failed: {e} ---")
+    status["load_seconds"] = round(time.perf_counter() - start, 2)
+
+
+def init_models(wait: bool = True):
+    """
+    Starts all the models, each on its own thread so cold start is the
+    slowest load instead of the sum. With wait=False, returns right away
+    and /ready reports when they are up.
+    """
+    global sessions
+    print("--- Initializing Vesi ---")
+    configure_mood(load_config())
+    set_tokenizer(Path(MODEL_PATH).name)     # Token counts saved in history are per model
+    sessions = SessionManager(MEMORY_PATH.parent, MEMORY_PATH, load_memory)
+    sessions.release(sessions.acquire(DEFAULT_SESSION))
+
+    threads = [
+        threading.Thread(target=load_model, args=(name,), name=f"vesi-load-{name}", daemon=True)
+        for name in MODEL_LOADERS
+    ]
+    for thread in threads:
+        thread.start()
+
+    def report():
+        for thread in threads:
+            thread.join()
+        failed = [name for name, status in model_status.items() if status["state"] != "ready"]
+        print("--- Vesi is Online ---" if not failed else f"--- Vesi is up without: {', '.join(failed)} ---")
+
+    if wait:
+        report()
+    else:
+        threading.Thread(target=report, name="vesi-load", daemon=True).start()
+
+
+def models_ready(*names) -> bool:
+    return all(model_status[name]["state"] == "ready" for name in names)
+
+
+def require_models(*names):
+    """503 (retry later) until the models an endpoint needs are loaded."""
+    if not models_ready(*names):
+        raise HTTPException(
+            status_code=503,
+            detail={"status": "loading", "models": {name: model_status[name]["state"] for name in names}},
+            headers={"Retry-After": "5"},
+        )
+
+### Chat pipeline ###
+
+# Sampling parameters shared by the one-shot and streaming /chat endpoints
+LLM_PARAMS = {
+    "top_k": 50,                # Choose fron N tokens
+    # "top_p": 0.9,             # min_p works better
+    "min_p": 0.05,              # Focus on tokens with 1% < probability
+    "repeat_penalty": 1.1,      # force model to use varied words
+    "max_tokens": 150,          # Prevent yapping (tsundere -> short)
+    "stop": STOP_SEQUENCES,     # Backstop only; LeakGuard cuts leaks in any case (see leak_guard)
+}
+
+# Vocabulary hints for Whisper
+STT_PROMPT = "Vesi is a girl's name. Arskaz is the user. Vesi, baka, hmph, smug, Arskaz."
+
+MOOD_HINTS = {
+    "tsun":    "[Vesi is currently in a cold, irritated mood.]",
+    "neutral": "[Vesi is in her usual smug, composed mood.]",
+    "dere":    "[Vesi is currently feeling flustered and softer than usual.]",
+}
+
+
+def prepare_turn(session: Session, user_input: str, draft: bool = False) -> tuple[list, str, float, dict]:
+    """
+    Builds the prompt for this turn with the user message appended.
+    The message only enters history once the turn is recorded.
+    A `draft` (speculative prefill) skips the active tools.
+    Returns (messages, emotion, temperature, prompt token usage).
+    """
+
+    current_temp = get_temperature(session.mood_score)
+
+    # Volatile context goes right before the user message, after the stable
+    # prefix, so the prefix stays byte-identical turn to turn (see prompt_cache)
+    with span("prompt.tools"):
+        # Passive tools — always injected
+        passive_ctx = get_passive_context()
+        emotion = get_emotion(session.mood_score)
+        context = f"CONTEXT:\n{passive_ctx}\n\n{MOOD_HINTS[emotion]}"
+
+        # Active tools — only when triggered by user input
+        active_ctx = None if draft else run_active_tools(user_input)
+        if active_ctx:
+            context += f"\n\nCONTEXT: {active_ctx}"
+
+    # build prompt within the token budget, recalling the memories relevant to this message
+    with session.lock, span("prompt.assemble"):
+        recalled = session.memory_index.recall(
+            compressed_blocks(session.history), user_input, MEMORY_RECALL_K, skip=MEMORY_PINNED
+        )
+        messages_to_send, usage = build_messages(
+            session.history + [{"role": "user", "content": user_input}],
+            tokenize_prompt,
+            context={"role": "system", "content": context},
+            recalled=recalled,
+        )
+    if draft:
+        return messages_to_send, emotion, current_temp, usage
+    print(f"--- Prompt tokens: {usage['total']}/{usage['budget']} "
+          f"(system {usage['system']}, memories {usage['memories']}, hot {usage['hot']}, context {usage['context']}) ---")
+
+    return messages_to_send, emotion, current_temp, usage
+
+
+def tokenize_prompt(text: str) -> list:
+    """Tokenizer handed to build_messages; rendered ChatML, so special tokens count as one."""
+    return llm.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+
+
+def generate_reply(messages: list, temperature: float, token: CancelToken | None = None):
+    """
+    Runs on the LLM worker. Restores the cached stable prefix, then opens a
+    completion stream over the full ChatML prompt so only the hot turns need
+    prefilling. Always a stream, so a LeakGuard can stop decoding mid-reply;
+    it is lazy, so prefill and decode are timed by the consumer.
+    With a `token`, decoding stops between tokens once the turn is cancelled.
+    """
+    if token and token.cancelled:
+        return (chunk for chunk in ())     # Superseded while queued: skip the prefill too
+
+    if prefix_cache:
+        with span("llm.prefix_cache"):
+            prefix = messages[:stable_prefix_length(messages)]
+            prefix_cache.ensure(llm, render_chatml(prefix, add_generation_prompt=False))
+
+    prompt = render_chatml(messages)
+    if speculator and speculator.unclaimed:
+        saved, wasted = speculator.claim(llm, llm.tokenize(prompt.encode("utf-8"), special=True))
+        observe("speculation.tokens_saved", saved)
+        observe("speculation.tokens_wasted", wasted)
+        observe("speculation.seconds_saved", saved * speculator.seconds_per_token)
+
+    chunks = llm.create_completion(
+        prompt,
+        temperature=temperature,    # temp, "creativity"
+        stream=True,
+        **LLM_PARAMS
+    )
+    return until_cancelled(chunks, token) if token else chunks
+
+
+def complete_reply(messages: list, temperature: float, token: CancelToken) -> dict:
+    """
+    Runs on the LLM worker. /chat's generation: the stream is consumed here
+    and stops as soon as a role leak begins (or the turn is cancelled) instead
+    of running to max_tokens. Returns the reply text, its token count and timings
+    (first_token_seconds counts from the start of generation, first_token_at
+    is the perf_counter time, for measuring from the request).
+    Raises TurnCancelled if the turn was cancelled before or during generation.
+    """
+    guard = LeakGuard()
+    completion_tokens = 0
+    first_token_at = None
+    start = time.perf_counter()
+
+    with span("llm.generate"):
+        chunks = generate_reply(messages, temperature, token)
+        try:
+            for chunk in chunks:
+                completion_tokens += 1
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                guard.feed(chunk["choices"][0]["text"])
+                if guard.leaked:
+                    break
+        finally:
+            chunks.close()
+    token.check()
+
+    done = time.perf_counter()
+    reply = {"text": guard.text.strip(), "completion_tokens": completion_tokens, "first_token_at": first_token_at,
+             "first_token_seconds": None, "decode_seconds": None}
+    if first_token_at:
+        reply["first_token_seconds"] = first_token_at - start
+        reply["decode_seconds"] = done - first_token_at
+        record("llm.decode", reply["decode_seconds"])
+    return reply
+
+
+def observe_generation(usage: dict, completion_tokens: int,
+                       first_token_seconds: float | None = None, decode_seconds: float | None = None):
+    """
+    Token counts and rates for /metrics. Prefill is an estimate: the prompt
+    minus the cached prefix, plus whatever part of the prefix ensure() evaluated.
+    """
+    if not metrics_enabled():
+        return
+    observe("llm.prompt_tokens", usage["total"])
+    observe("llm.completion_tokens", completion_tokens)
+    if first_token_seconds:
+        prefill_tokens = usage["total"]
+        if prefix_cache:
+            prefill_tokens -= prefix_cache.last_tokens - prefix_cache.last_prefill_tokens
+        observe("llm.prefill_tokens_per_second", max(prefill_tokens, 1) / first_token_seconds)
+    if decode_seconds and completion_tokens > 1:
+        observe("llm.decode_tokens_per_second", (completion_tokens - 1) / decode_seconds)
+
+
+def speculate(session: Session, draft: str = "") -> bool:
+    """
+    Queues a speculative prefill of the session's next prompt, with `draft`
+    as the user message so far. Supersedes earlier ones. Skipped while a turn
+    is running there (history is about to change). Returns True if queued.
+    """
+    if not speculator or not models_ready("llm") or turns.running(session.id):
+        return False
+    generation = speculator.begin((session.id, len(session.history), draft))
+    if generation is None:
+        return False
+    messages, _, _, _ = prepare_turn(session, draft, draft=True)
+    try:
+        scheduler.submit("llm", speculative_prefill, messages, generation, priority=BACKGROUND)
+    except QueueFullError:
+        return False
+    return True
+
+
+def speculative_prefill(messages: list, generation: int):
+    """Runs on the LLM worker at background priority; gives way to any real request."""
+    if not speculator.current(generation):
+        return
+    with span("llm.speculate") as timer:
+        if prefix_cache:
+            prefix = messages[:stable_prefix_length(messages)]
+            prefix_cache.ensure(llm, render_chatml(prefix, add_generation_prompt=False))
+        tokens = llm.tokenize(render_chatml_open(messages).encode("utf-8"), special=True)
+        evaluated = speculator.prefill(llm, tokens, generation, lambda: scheduler.interactive_waiting("llm"))
+    if timer.seconds and evaluated:
+        observe("speculation.seconds", timer.seconds)
+
+
+def finish_turn(session: Session, token: CancelToken):
+    """Unregisters a recorded turn and gets the next prompt ready (compression does that itself once done)."""
+    turns.finish(token)
+    if not session.compression_lock.locked():
+        speculate(session)
+
+
+async def speculate_draft(session_id: str, text: str) -> bool:
+    """speculate() for a session by id, off the event loop."""
+    session = await acquire_session(session_id)
+    try:
+        return await asyncio.to_thread(speculate, session, text)
+    finally:
+        sessions.release(session)
+
+
+def synthesize_speech(text: str, speed: float, audio_format: str = "wav") -> dict:
+    """
+    Runs Kokoro on `text` (or reuses cached audio).
+    Returns the clip's URL and its lip sync envelope.
+    Encoding runs on its own worker, so the TTS worker moves on to the next
+    sentence right away; /audio waits for the encode if it is fetched early.
+    """
+    with span("tts.synthesize") as timer:
+        if tts_cache:
+            samples, sample_rate = tts_cache.create(vocal_cord, text, voice="af_bella", speed=speed, lang="en-us")
+        else:
+            samples, sample_rate = vocal_cord.create(
+                text,
+                voice="af_bella",
+                speed=speed,
+                lang="en-us"
+            )
+    if timer.seconds:
+        observe("tts.audio_seconds_per_second", len(samples) / sample_rate / timer.seconds)
+
+    encoded = scheduler.submit("encode", encode_speech, samples, sample_rate, audio_format, block=True)
+    audio_id = audio_store.put(encoded, AUDIO_FORMATS[audio_format][0])
+    with span("tts.lipsync"):
+        lipsync = lipsync_envelope(samples, sample_rate)
+    return {"audio_url": f"{AUDIO_URL}/{audio_id}", "lipsync": lipsync}
+
+
+def encode_speech(samples: np.ndarray, sample_rate: int, audio_format: str) -> bytes:
+    """Runs on the encode worker."""
+    with span("tts.encode"):
+        return encode_audio(samples, sample_rate, audio_format)
+
+
+def pick_audio_format(requested: str) -> str:
+    """The client's preferred format if this install can encode it, else WAV."""
+    return requested if requested in available_formats() else "wav"
+
+
+def record_turn(session: Session, user_input: str, full_response: str, interrupted: bool = False):
+    """
+    Records the user message and Vesi's reply, then fires compression.
+    An interrupted turn keeps only what reached the user: the reply is
+    flagged, or left out entirely if none of it was delivered.
+    """
+    with session.lock, span("history.append"):
+        # Add user message and VEsi response
+        turn = [{"role": "user", "content": user_input}]
+        if full_response:
+            turn.append({"role": "assistant", "content": full_response})
+            if interrupted:
+                turn[-1]["interrupted"] = True
+        session.history.extend(turn)
+        session.store.append(turn, session.history)
+        needs_compression = should_compress(session.history)
+
+    # Fire compression if raw turn count exceeds threshold
+    # Runs in the background, the reply never waits for it
+    if needs_compression:
+        start_compression(session)
+
+
+def start_compression(session: Session):
+    """Starts a background compression unless one is already running for this session."""
+    if not session.compression_lock.acquire(blocking=False):
+        return
+    threading.Thread(target=run_compression, args=(session,), name="vesi-compression", daemon=True).start()
+
+
+def run_compression(session: Session):
+    """
+    Summarizes a snapshot of history on the LLM worker at background priority,
+    then merges the block into the live history. Turns added meanwhile survive
+    the merge. Then folds old blocks into higher levels while any level is over
+    its threshold. Releases the compression_lock taken by start_compression.
+    """
+    try:
+        with session.lock:
+            snapshot = list(session.history)
+        turns_to_compress = get_compressible_turns(snapshot)
+        if not turns_to_compress:
+            return
+
+        compressed_block = scheduler.submit(
+            "llm", summarize_turns, snapshot, turns_to_compress, llm, priority=BACKGROUND
+        ).result()
+        if compressed_block is None:
+            return
+
+        with session.lock:
+            session.history = merge_compressed(session.history, turns_to_compress, compressed_block)
+            session.store.write_snapshot(session.history)
+            session.memory_index.add(compressed_block)
+            session.memory_index.save()
+
+        while fold_memory(session):
+            pass
+        speculate(session)
+
+    except QueueFullError:
+        print("--- LLM queue full, compression postponed to a later turn ---")
+    finally:
+        session.compression_lock.release()
+
+
+def fold_memory(session: Session) -> bool:
+    """One fold of the oldest blocks at an over-threshold level. Returns True if it folded."""
+    with session.lock:
+        blocks_to_fold = get_foldable_blocks(session.history, tokenize_prompt)
+    if not blocks_to_fold:
+        return False
+
+    folded_block = scheduler.submit("llm", summarize_blocks, blocks_to_fold, llm, priority=BACKGROUND).result()
+    if folded_block is None:
+        return False
+
+    with session.lock:
+        session.history = merge_folded(session.history, blocks_to_fold, folded_block)
+        session.store.write_snapshot(session.history)
+        for block in blocks_to_fold:
+            session.memory_index.remove(block)
+        session.memory_index.add(folded_block)
+        session.memory_index.save()
+    return True
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_chat(session: Session, user_input: str, chunks, emotion: str, usage: dict, audio_format: str,
+                token: CancelToken, arrived: float):
+    """
+    Generator behind /chat/stream. Consumes the LLM `chunks` stream and yields
+    a `token` event per generated delta and an `audio` event (URL + lip sync
+    envelope) per synthesized sentence, then a trailing `done` event with
+    text, mood, emotion, timings and prompt token usage. Timings count
+    from `arrived`, when the request came in, like /chat's.
+
+    Sentences are spoken at the speed of the mood *before* this reply,
+    since the new score needs the finished text.
+    Once `token` is cancelled it stops between tokens and sentences and
+    records only the sentences whose audio went out.
+    Releases the session and the turn when done.
+    """
+    try:
+        yield from _stream_chat(session, user_input, chunks, emotion, usage, audio_format, token, arrived)
+    finally:
+        finish_turn(session, token)
+        sessions.release(session)
+
+
+def _stream_chat(session: Session, user_input: str, chunks, emotion: str, usage: dict, audio_format: str,
+                 token: CancelToken, arrived: float):
+    speed = get_tts_speed(session.mood_score)
+    pipeline = SpeechPipeline(
+        lambda sentence, index: synthesize_speech(sentence, speed, audio_format),
+        # Sentences wait for room rather than failing mid-reply
+        submit=lambda fn, *args: scheduler.submit("tts", fn, *args, block=True),
+    )
+
+    start = time.perf_counter()     # Generation starts here; prefill rate counts from it
+    first_token_at = None
+    first_audio_at = None
+    guard = LeakGuard()
+    completion_tokens = 0
+    spoken = []         # Sentences whose audio went out: what was delivered if cut short
+    mood_signals = []
+    recorded = False
+
+    def audio_event(index, sentence, clip):
+        nonlocal first_audio_at
+        if first_audio_at is None:
+            first_audio_at = time.perf_counter()
+        spoken.append(sentence)
+        return sse_event("audio", {"index": index, "text": sentence, **clip})
+
+    try:
+        # chunks ends early by itself once the turn is cancelled (until_cancelled)
+        for chunk in chunks:
+            completion_tokens += 1
+            delta = chunk["choices"][0]["text"]
+            if not delta:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+
+            # Only text that cannot be the start of a leak goes out; generation stops once one begins
+            safe = guard.feed(delta)
+            if safe:
+                yield sse_event("token", {"text": safe})
+                pipeline.feed(safe)
+                for index, sentence, clip in pipeline.ready():
+                    yield audio_event(index, sentence, clip)
+            if guard.leaked:
+                break
+        chunks.close()
+
+        generation_done = time.perf_counter()
+        if first_token_at:
+            record("llm.first_token", first_token_at - arrived)
+            record("llm.decode", generation_done - first_token_at)
+            observe_generation(usage, completion_tokens, first_token_at - start, generation_done - first_token_at)
+
+        if not token.cancelled:
+            tail = guard.finish()
+            if tail:
+                yield sse_event("token", {"text": tail})
+                pipeline.feed(tail)
+            pipeline.finish()
+        for index, sentence, clip in pipeline.drain():
+            if token.cancelled:
+                break
+            yield audio_event(index, sentence, clip)
+
+        if token.cancelled:
+            pipeline.cancel()
+            full_response = " ".join(spoken)
+            observe("chat.cancelled", 1)
+            print(f"--- Turn {token.request_id} {token.reason} after {len(spoken)} sentences ---")
+        else:
+            full_response = guard.text.strip()
+        if full_response:
+            with span("mood"):
+                session.mood_score, mood_signals = score_turn(full_response, user_input, session.mood_score)
+            observe("mood.score", session.mood_score)
+        record_turn(session, user_input, full_response, interrupted=token.cancelled)
+        recorded = True
+        record("chat.stream", time.perf_counter() - arrived)
+    finally:
+        if not recorded:
+            # Client went away (or something failed) mid-reply: stop the work, keep what was delivered
+            token.cancel("disconnected")
+            chunks.close()
+            pipeline.cancel()
+            record_turn(session, user_input, " ".join(spoken), interrupted=True)
+
+    def ms_since_start(t):
+        return round((t - arrived) * 1000) if t else None
+
+    ttft_ms = ms_since_start(first_token_at)
+    print(f"--- TTFT: {ttft_ms} ms, first audio: {ms_since_start(first_audio_at)} ms ---")
+
+    yield sse_event("done", {
+        "request_id": token.request_id,
+        "cancelled": token.cancelled,
+        "text": full_response,
+        "mood": session.mood_score,
+        "mood_signals": [signal for signal, _ in mood_signals],
+        "emotion": emotion,
+        "audio_format": audio_format,
+        "audio_chunks": len(spoken),
+        "ttft_ms": ttft_ms,
+        "ttfa_ms": ms_since_start(first_audio_at),
+        "generation_ms": ms_since_start(generation_done),
+        "prompt_tokens": usage,
+    })
+
+
+def transcribe(audio: np.ndarray) -> str:
+    """Runs Faster Whisper on a 16 kHz float32 buffer. Segments decode lazily, so join here."""
+    with span("stt.transcribe") as timer:
+        segments, info = stt_model.transcribe(
+            audio,
+            beam_size=5,
+            language="en",
+            task="transcribe",
+            initial_prompt=STT_PROMPT
+        )
+        text = " ".join([segment.text for segment in segments])
+    if timer.seconds:
+        observe("stt.real_time_factor", timer.seconds / (len(audio) / STT_SAMPLE_RATE))
+    return text
+
+
+def transcribe_batch(audios: list) -> list[str]:
+    """
+    Transcribes several clips (each at most one Whisper window) in one batch:
+    concatenated, with clip_timestamps marking each clip. faster-whisper 1.2.1
+    takes these in seconds and decodes every given clip as its own batch row,
+    never joining two (requirements.txt pins it). Returns one text per clip.
+    """
+    offsets = np.cumsum([0] + [len(audio) for audio in audios]) / STT_SAMPLE_RATE    # Seconds
+    with span("stt.transcribe_batch") as timer:
+        segments, info = stt_batched.transcribe(
+            np.concatenate(audios),
+            clip_timestamps=[{"start": float(offsets[i]), "end": float(offsets[i + 1])} for i in range(len(audios))],
+            batch_size=len(audios),
+            beam_size=5,
+            language="en",
+            task="transcribe",
+            initial_prompt=STT_PROMPT
+        )
+        texts = [[] for _ in audios]
+        for segment in segments:
+            # Segment times are in the concatenated audio; the midpoint is safely inside its clip
+            clip = int(np.searchsorted(offsets, (segment.start + segment.end) / 2, side="right")) - 1
+            texts[min(max(clip, 0), len(audios) - 1)].append(segment.text)
+    if timer.seconds:
+        observe("stt.real_time_factor", timer.seconds / offsets[-1])
+    return [" ".join(text) for text in texts]
+
+
+def transcribe_segments(audio: np.ndarray, beam_size: int) -> list:
+    """Like transcribe, but keeps segment timing: [(start, end, text), ...]."""
+    segments, info = stt_model.transcribe(
+        audio,
+        beam_size=beam_size,
+        language="en",
+        task="transcribe",
+        initial_prompt=STT_PROMPT
+    )
+    return [(segment.start, segment.end, segment.text) for segment in segments]
+
 
 ### API Endpoint ###
 
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    """A full model queue means Vesi is overloaded — tell the client to retry."""
+    return JSONResponse(
+        status_code=503,
+        content={"status": "busy", "message": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.get("/health")
+async def health():
+    """Liveness: the server is up. Per-model load state and time included."""
+    return {"status": "ok", "models": model_status}
+
+
+@app.get("/ready")
+async def ready():
+    """200 once every model is loaded (and warmed up), 503 until then."""
+    is_ready = models_ready(*model_status)
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "models": model_status},
+    )
+
+
+@app.get("/queues")
+async def queues():
+    """Queue depth and wait time per model worker."""
+    stats = scheduler.stats()
+    if stt_batcher:
+        stats["stt"]["batching"] = stt_batcher.stats()
+    return stats
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """
+    Prometheus text format: stage timings, TTFT, token rates, STT/TTS speed and
+    mood from the exporter, plus history size, mood, queues, held audio and
+    the prompt prefix cache read at scrape time.
+    Plain def: history sizes stat files, so it runs in the threadpool.
+    """
+    if prometheus is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS = False)")
+
+    loaded = sessions.loaded() if sessions else []
+    queue_stats = scheduler.stats()
+    text = prometheus.render()
+    text += format_gauge("vesi_history_entries", "Entries in a loaded session's history",
+                         [({"session": s.id}, len(s.history)) for s in loaded])
+    text += format_gauge("vesi_history_bytes", "Snapshot plus journal size of a loaded session",
+                         [({"session": s.id}, s.store.size_bytes()) for s in loaded])
+    text += format_gauge("vesi_mood", "Current mood score of a loaded session",
+                         [({"session": s.id}, s.mood_score) for s in loaded])
+    text += format_gauge("vesi_queue_depth", "Queued plus running jobs per model worker",
+                         [({"model": name}, q["depth"]) for name, q in queue_stats.items()])
+    store_stats = audio_store.stats()
+    text += format_gauge("vesi_audio_store_clips", "Synthesized clips held for the client to fetch",
+                         [({}, store_stats["clips"])])
+    text += format_gauge("vesi_audio_store_bytes", "Bytes of synthesized clips held for the client",
+                         [({}, store_stats["bytes"])])
+    if prefix_cache:
+        cache_stats = prefix_cache.stats()
+        text += format_gauge("vesi_prefix_cache_lookups", "Stable prompt prefix lookups by outcome (since start)",
+                             [({"outcome": outcome}, cache_stats[outcome])
+                              for outcome in ("resident_hits", "restores", "evaluations")])
+        text += format_gauge("vesi_prefix_cache_tokens", "Tokens in the last stable prompt prefix",
+                             [({}, cache_stats["prefix_tokens"])])
+    return Response(text, media_type="text/plain; version=0.0.4")
+
+
+@app.get("/tts/cache")
+async def tts_cache_stats():
+    """TTS cache hit rate and bytes saved, for sizing it."""
+    return tts_cache.stats() if tts_cache else {"enabled": False}
+
+
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+@app.get("/audio/formats")
+async def audio_formats():
+    """Audio formats /chat can return, for the client to pick from."""
+    return {"formats": available_formats()}
+
+
+@app.get("/audio/{audio_id}")
+async def get_audio(audio_id: str, request: Request):
+    """Serves a synthesized clip from memory. Supports single byte ranges (seeking, media elements)."""
+    clip = audio_store.get(audio_id)
+    if clip is None:
+        raise HTTPException(status_code=404, detail="Audio not found or expired")
+    data, media_type = clip
+    if isinstance(data, Future):
+        try:
+            data = await asyncio.wrap_future(data)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Audio encoding failed: {e}")
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": "no-store"}
+
+    range_header = request.headers.get("range")
+    match = RANGE_RE.match(range_header.strip()) if range_header else None
+    if not match or match.groups() == ("", ""):
+        return Response(data, media_type=media_type, headers=headers)
+
+    size = len(data)
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last) if last else size - 1, size - 1)
+    else:
+        start, end = max(size - int(last), 0), size - 1     # Suffix range: the last N bytes
+    if start > end or start >= size:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(data[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+
 @app.post("/transcribe")
 async def transcribe_audio(audio: UploadFile = File(...)):
     """Transcribe audio to text using Faster Whisper"""
-    
-    # Save to tmp file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-        content = await audio.read()
-        temp_audio.write(content)
-        temp_path = temp_audio.name
-    
+    require_models("stt")
+
+    # Decode straight from the upload bytes, trimming silence at both ends
+    content = await audio.read()
+    with span("stt.decode"):
+        samples = await asyncio.to_thread(load_stt_audio, content)
+    if len(samples) == 0:
+        return {"text": ""}
+
+    if stt_batcher and len(samples) <= STT_BATCH_MAX_SECONDS * STT_SAMPLE_RATE:
+        text = await asyncio.wrap_future(stt_batcher.submit(samples))
+    else:
+        text = await scheduler.run("stt", transcribe, samples)
+    return {"text": text.strip()}
+
+
+@app.websocket("/transcribe/stream")
+async def transcribe_stream(websocket: WebSocket):
+    """
+    Incremental STT while push-to-talk is held.
+    Client sends binary audio chunks (MediaRecorder pieces of one stream),
+    then the text message "end" on release.
+    Server sends {"type": "partial", "text"} while audio arrives and
+    {"type": "final", "text"} after "end".
+    With ?session_id=..., partials also prefill that session's next prompt.
+    """
+    await websocket.accept()
+    if not models_ready("stt"):
+        await websocket.close(code=1013, reason="Speech-to-text is still loading")
+        return
+    transcriber = StreamingTranscriber()
+    session_id = websocket.query_params.get("session_id")    # Partials double as drafts for speculative prefill
+    partial_job = None
+    last_partial_at = 0.0
+
+    async def send_partial():
+        try:
+            text = await scheduler.run("stt", transcriber.partial, transcribe_segments)
+            await websocket.send_json({"type": "partial", "text": text})
+            if session_id and text:
+                await speculate_draft(session_id, text)
+        except QueueFullError:
+            pass    # Busy — skip this partial, the final still comes
+        except Exception as e:
+            print(f"--- Partial transcription failed: {e} ---")
+
     try:
-        segments, info = stt_model.transcribe(
-            temp_path, 
-            beam_size=5, 
-            language="en", 
-            task="transcribe", 
-            initial_prompt="Vesi is a girl's name. Arskaz is the user. Vesi, baka, hmph, smug, Arskaz."
-        )
-        text = " ".join([segment.text for segment in segments])
-        
-        return {"text": text.strip()}
-    
-    finally:
-        os.remove(temp_path)
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+            if message.get("bytes"):
+                transcriber.add(message["bytes"])
+                now = time.perf_counter()
+                # At most one partial in flight per stream
+                if (partial_job is None or partial_job.done()) and now - last_partial_at >= PARTIAL_INTERVAL:
+                    last_partial_at = now
+                    partial_job = asyncio.create_task(send_partial())
+
+            elif message.get("text") == "end":
+                if partial_job:
+                    await partial_job
+                text = await scheduler.run("stt", transcriber.final, transcribe_segments)
+                await websocket.send_json({"type": "final", "text": text})
+                await websocket.close()
+                return
+
+    except WebSocketDisconnect:
+        pass
+    except QueueFullError as e:
+        await websocket.close(code=1013, reason=str(e))    # 1013 = try again later
 
 
 @app.post("/remember")
-async def remember(request: RememberRequest):
+def remember(request: RememberRequest):
     """
     Adds a new user fact to vesi_config.yaml and immediately
-    updates history[0] in the live session. No restart needed.
+    updates history[0] in every live session. No restart needed;
+    sessions loaded later pick it up from the YAML.
+    Plain def: FastAPI runs it in the threadpool, keeping file I/O off the loop.
     """
-    global history
-
     fact = request.fact.strip()
     if not fact:
         return {"status": "error", "message": "Empty fact ignored."}
@@ -227,122 +1025,160 @@ async def remember(request: RememberRequest):
     save_config(config)
 
     # Rebuild system prompt and update live history[0] immediately
-    system_prompt_content = build_system_prompt(config)
-    history[0] = {"role": "system", "content": system_prompt_content}
-    save_memory(history)
+    system_message = {"role": "system", "content": build_system_prompt(config)}
+    for session in sessions.loaded():
+        with session.lock:
+            session.history[0] = system_message
+            session.store.set_system(system_message)
 
     print(f"--- Remembered: '{fact}' ---")
     return {"status": "ok", "fact": fact, "total_facts": len(config["user_facts"])}
 
 
+async def acquire_session(session_id: str) -> Session:
+    """Loads (or reuses) a session off the event loop. Bad ids are a 400."""
+    try:
+        return await asyncio.to_thread(sessions.acquire, session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def start_turn(session: Session, request_id: str | None) -> CancelToken:
+    """Registers a turn off the event loop (it may wait for a superseded one). A duplicate id is a 409."""
+    try:
+        return await asyncio.to_thread(turns.start, session.id, request_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
 @app.post("/chat")
 async def chat(request: ChatRequest):
-    global vesi_mood_score, current_temp, history
-    
-    # Clean up old audio files
-    for f in os.listdir(STATIC_DIR):
-        if f.endswith(".wav"):
-            try:
-                os.remove(os.path.join(STATIC_DIR, f))
-            except:
-                pass
-    
-    # Add user message to history
+    require_models("llm", "tts")
+    start = time.perf_counter()
+    session = await acquire_session(request.session_id)
     user_input = request.message
-    history.append({"role": "user", "content": user_input})
-    
-    current_temp = get_temperature(vesi_mood_score)
-
-    # build prompt
-    messages_to_send = build_messages(history)
-
-    # Passive tools — always inject into system prompt
-    passive_ctx = get_passive_context()
-    emotion = get_emotion(vesi_mood_score)
-    mood_hints = {
-        "tsun":    "[Vesi is currently in a cold, irritated mood.]",
-        "neutral": "[Vesi is in her usual smug, composed mood.]",
-        "dere":    "[Vesi is currently feeling flustered and softer than usual.]",
-    }
-    messages_to_send[0] = {
-        "role": "system",
-        "content": messages_to_send[0]["content"] + f"\n\nCONTEXT:\n{passive_ctx}\n\n{mood_hints[emotion]}"
-    }
-
-    # Active tools — only when triggered by user input
-    active_ctx = run_active_tools(user_input)
-    if active_ctx:
-        messages_to_send.insert(-1, {"role": "system", "content": f"CONTEXT: {active_ctx}"})
-
-
-    ### LLM
-    # parameters for llm
-    completion = llm.create_chat_completion(
-        messages=messages_to_send, 
-        temperature=current_temp,   # temp, "creativity"
-        top_k=50,                   # Choose fron N tokens
-        # top_p=0.9,                # min_p works better
-        min_p=0.05,                 # Focus on tokens with 1% < probability
-        repeat_penalty=1.1,        # force model to use varied words
-        max_tokens=150,             # Prevent yapping (tsundere -> short)
-        stop=[                      # Prevent model from talking to itself or unwanted words
-            "<|eot_id|>",
-            "<|im_end|>",
-            "<|end_of_text|>",
-            "<|im_start|>",
-            "<user>",
-            "arskaz",
-            "<|user",
-            "<|User>",
-            "<|arskaz>"
-            "\n<user>",
-            "User:", "arskaz:",
-            "user:", "Arskaz:",
-            "\nUser:", "\nuser:",
-        ]
-    )
+    token = None
+    try:
+        token = await start_turn(session, request.request_id)
+        audio_format = pick_audio_format(request.audio_format)
+        messages_to_send, emotion, temperature, usage = await asyncio.to_thread(prepare_turn, session, user_input)
 
-    raw_response = completion["choices"][0]["message"]["content"]
-    full_response = clean_response(raw_response)
-    vesi_mood_score = calculate_mood(full_response, user_input, vesi_mood_score)
-    
-    # TTS
-    samples, sample_rate = vocal_cord.create(
-        full_response,
-        voice="af_bella",
-        speed=get_tts_speed(vesi_mood_score),
-        lang="en-us"
+        ### LLM
+        reply = await scheduler.run("llm", complete_reply, messages_to_send, temperature, token)
+        if reply["first_token_at"]:
+            record("llm.first_token", reply["first_token_at"] - start)
+        observe_generation(usage, reply["completion_tokens"], reply["first_token_seconds"], reply["decode_seconds"])
+        token.check()
+        full_response = reply["text"]
+
+        with span("mood"):
+            mood_score, mood_signals = score_turn(full_response, user_input, session.mood_score)
+
+        # TTS
+        clip = await scheduler.run(
+            "tts", unless_cancelled, token, synthesize_speech, full_response, get_tts_speed(mood_score), audio_format
+        )
+        token.check()
+
+        # Delivered from here on
+        session.mood_score = mood_score
+        observe("mood.score", session.mood_score)
+        await asyncio.to_thread(record_turn, session, user_input, full_response)
+        record("chat", time.perf_counter() - start)
+
+        return {
+            "request_id": token.request_id,
+            "text": full_response,
+            "mood": session.mood_score,
+            "mood_signals": [signal for signal, _ in mood_signals],
+            "emotion": emotion,
+            "audio_url": clip["audio_url"],
+            "audio_format": audio_format,
+            "lipsync": clip["lipsync"],
+            "prompt_tokens": usage,
+        }
+    except TurnCancelled:
+        # The reply never reached the client: only the user's message is kept
+        observe("chat.cancelled", 1)
+        await asyncio.to_thread(record_turn, session, user_input, "")
+        return {"request_id": token.request_id, "cancelled": True, "reason": token.reason}
+    finally:
+        if token:
+            await asyncio.to_thread(finish_turn, session, token)
+        sessions.release(session)
+
+
+@app.post("/chat/draft")
+async def chat_draft(request: DraftRequest):
+    """
+    Speculative prefill: the user's next message so far, as they type or
+    speak. The next /chat in this session then only has to evaluate what
+    the draft got wrong. Cheap to call often; repeats are ignored.
+    """
+    return {"queued": await speculate_draft(request.session_id, request.text)}
+
+
+@app.get("/speculation")
+async def speculation_stats():
+    """Speculative prefill: tokens and TTFT saved against compute wasted on stale drafts."""
+    return speculator.stats() if speculator else {"enabled": False}
+
+
+@app.post("/chat/cancel")
+async def cancel_chat(request: CancelRequest):
+    """
+    Barge-in: stops a running /chat or /chat/stream turn, by request id or by
+    session. Generation stops at the next token and speech at the next
+    sentence; history keeps only what was delivered.
+    """
+    if not request.request_id and not request.session_id:
+        raise HTTPException(status_code=400, detail="Give a request_id or a session_id")
+    token = turns.cancel(request.request_id, request.session_id)
+    return {"cancelled": token is not None, "request_id": token.request_id if token else request.request_id}
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming variant of /chat (Server-Sent Events).
+    Tokens arrive as they are generated, sentence audio as soon as Kokoro
+    finishes it; mood and emotion follow in `done`.
+    """
+    require_models("llm", "tts")
+    arrived = time.perf_counter()
+    session = await acquire_session(request.session_id)
+    token = None
+    try:
+        token = await start_turn(session, request.request_id)
+        user_input = request.message
+        audio_format = pick_audio_format(request.audio_format)
+        messages_to_send, emotion, temperature, usage = await asyncio.to_thread(prepare_turn, session, user_input)
+
+        # Queue the generation now so a full LLM queue is a 503, not a broken stream
+        chunks = scheduler.stream("llm", generate_reply, messages_to_send, temperature, token)
+    except BaseException:
+        if token:
+            turns.finish(token)
+        sessions.release(session)
+        raise
+
+    # stream_chat releases the session and the turn once the reply is recorded
+    return StreamingResponse(
+        stream_chat(session, user_input, chunks, emotion, usage, audio_format, token, arrived),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
     )
-    
-    # Save generated audio to static/
-    timestamp = int(time.time())
-    audio_filename = f"vesi_{timestamp}.wav"
-    audio_path = os.path.join(STATIC_DIR, audio_filename)
-    
-    with wave.open(audio_path, 'wb') as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(sample_rate)
-        wf.writeframes((samples * 32767).astype(np.int16).tobytes())
-    
-    # Add VEsi response
-    history.append({"role": "assistant", "content": full_response})
-    save_memory(history)
 
-    # Fire compression if raw turn count exceeds threshold
-    # Runs after response is sent
-    if should_compress(history):
-        history = compress(history, llm)
-    
-    return {
-        "text": full_response,
-        "mood": vesi_mood_score,
-        "emotion": emotion,
-        "audio_url": f"http://localhost:8000/static/{audio_filename}?t={os.urandom(4).hex()}"
-    }
+
+@app.on_event("shutdown")
+def save_sessions():
+    """Evicted sessions save their mood on the way out; do the same for loaded ones."""
+    if sessions:
+        sessions.save_all()
+
 
 def main():
-    init_models()
+    init_models(wait=False)
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
 if __name__ == "__main__":
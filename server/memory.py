@@ -1,16 +1,35 @@
 ### Memory Compression System ###
 # Handles cold memory compression and prompt sandwich assembly.
-# Compression fires after /chat saves
+# Compression fires after /chat saves, in the background (see main.start_compression)
+# Two tiers: raw turns -> level 1 blocks, then the oldest blocks of a level
+# fold into one block of the next level, so long-term memory stays bounded.
 
 ### Imports ###
-import json
-from pathlib import Path
+from prompt_cache import render_chatml
+from metrics import span
+
 
 ### Config ###
 COMPRESSION_THRESHOLD = 60   # Raw turns before compression fires
 KEEP_RECENT = 10             # Raw turns to preserve after compression
 COMPRESSION_TEMP = 0.5       # Lower temp for consistent summaries
-MEMORY_PATH = Path("../logs/chat_log.json")
+
+# Folding blocks into higher-level summaries
+FOLD_BLOCK_THRESHOLD = 12    # Blocks at one level before its oldest get folded
+FOLD_TOKEN_THRESHOLD = 4096  # Or: total memory tokens before the lowest level gets folded
+FOLD_COUNT = 4               # Oldest blocks merged per fold
+
+# Prompt budget (tokens). n_ctx is 12288; the rest is headroom for the reply
+PROMPT_TOKEN_BUDGET = 6144
+HOT_TURNS = 6                # Most recent raw turns considered for the prompt
+HOT_RESERVE = 1536           # Held back from memories for hot turns + context, so the
+                             # memory selection (the cached prefix) doesn't shift turn to turn
+
+# Retrieval (see memory_index)
+MEMORY_PINNED = 2            # Newest blocks always in the prompt (part of the cached prefix)
+MEMORY_RECALL_K = 3          # Older blocks recalled by relevance to the user message
+
+RECALL_HEADER = "RECALLED MEMORIES (from earlier conversations, background only):"
 
 COMPRESSOR_PROMPT = (
     "Summarize the following conversation between Vesi and Arskaz in a single short "
@@ -19,6 +38,23 @@ COMPRESSOR_PROMPT = (
     "Write only the summary itself, nothing else."
 )
 
+FOLD_PROMPT = (
+    "Below are several of Vesi's memories of Arskaz, oldest first. Merge them into a single "
+    "short narrative paragraph in Vesi's voice, keeping the events and feelings that matter "
+    "most, without admitting she cared. Do not invent events. No bullet points. No preamble. "
+    "Write only the merged memory itself, nothing else."
+)
+
+# Ends the stable prompt prefix; everything after it changes turn to turn
+SESSION_BREAK = {
+    "role": "system",
+    "content": (
+        "--- PAST MEMORIES END ---\n"
+        "The above are memories from previous conversations, for background reference only.\n"
+        "The CURRENT conversation starts now. Respond only to what follows."
+    )
+}
+
 
 ### Helper functions ###
 
@@ -32,9 +68,46 @@ def _is_compressed_block(entry: dict) -> bool:
     return entry.get("type") == "compressed_block"
 
 
-def _strip_type_field(entry: dict) -> dict:
-    """Returns entry without the type field — safe to send to Llama."""
-    return {k: v for k, v in entry.items() if k != "type"}
+def _block_level(block: dict) -> int:
+    """1 for summaries of raw turns, 2+ for summaries of summaries."""
+    return block.get("level", 1)
+
+
+def _turns_covered(block: dict) -> int:
+    """Raw turns a block summarizes. Older blocks have no count, but their range is contiguous."""
+    return block.get("turns", block["turn_range"][1] - block["turn_range"][0] + 1)
+
+
+def _to_message(entry: dict) -> dict:
+    """Returns just role and content — drops type, level, turn_range, n_tokens, tokenizer. Safe to send to Llama."""
+    return {"role": entry["role"], "content": entry["content"]}
+
+
+_tokenizer_id = None
+
+
+def set_tokenizer(tokenizer_id: str | None):
+    """Names the model entry_tokens counts for; counts cached for another one get recounted."""
+    global _tokenizer_id
+    _tokenizer_id = tokenizer_id
+
+
+def entry_tokens(entry: dict, tokenize) -> int:
+    """
+    Token count of entry as rendered in the prompt. Tokenized once,
+    then cached on the entry as n_tokens (and persisted with it), tagged
+    with the set_tokenizer id so a model change recounts it.
+    `tokenize(text) -> list` should be the loaded model's tokenizer.
+    """
+    if "n_tokens" not in entry or entry.get("tokenizer") != _tokenizer_id:
+        entry["n_tokens"] = len(tokenize(render_chatml([_to_message(entry)], add_generation_prompt=False)))
+        entry["tokenizer"] = _tokenizer_id
+    return entry["n_tokens"]
+
+
+def compressed_blocks(history: list) -> list:
+    """Compressed memory blocks in history order (newest first)."""
+    return [e for e in history if _is_compressed_block(e)]
 
 
 ### Core functions ###
@@ -60,17 +133,12 @@ def get_compressible_turns(history: list) -> list:
     return raw_turns[:compress_count]
 
 
-def compress(history: list, llm) -> list:
+def summarize_turns(history: list, turns_to_compress: list, llm) -> dict | None:
     """
-    Compresses the oldest 50 raw turns into a single compressed block.
-    Removes original turns from history, inserts the block, saves to disk.
-    Returns the updated history.
+    Runs the compressor over `turns_to_compress` (taken from `history`).
+    Returns the compressed block, or None if the LLM call failed.
+    Read-only — safe to run on a snapshot while new turns arrive.
     """
-    turns_to_compress = get_compressible_turns(history)
-
-    if not turns_to_compress:
-        return history
-
     print(f"--- Compressing {len(turns_to_compress)} turns into a memory block ---")
 
     # Build conversation text for the compressor
@@ -78,80 +146,213 @@ def compress(history: list, llm) -> list:
         f"{t['role'].capitalize()}: {t['content']}" for t in turns_to_compress
     )
 
-    # Determine turn range from history indices
-    indices = [i for i, e in enumerate(history) if _is_raw_turn(e)]
-    turn_range = [indices[0], indices[len(turns_to_compress) - 1]]
+    # Turn range counts raw turns over the whole conversation, so it still
+    # means something once the turns are gone: continue after what blocks cover
+    first_turn = sum(_turns_covered(b) for b in compressed_blocks(history))
+    turn_range = [first_turn, first_turn + len(turns_to_compress) - 1]
 
     # Call Llama for compression
     # Assistant prefill forces model to start summary directly, skipping preamble
     try:
-        completion = llm.create_chat_completion(
-            messages=[
-                {"role": "system", "content": COMPRESSOR_PROMPT},
-                {"role": "user", "content": conversation_text},
-                {"role": "assistant", "content": "Arskaz came to me"}
-            ],
-            temperature=COMPRESSION_TEMP,
-            max_tokens=300,
-            repeat_penalty=1.1,
-        )
+        with span("memory.compress"):
+            completion = llm.create_chat_completion(
+                messages=[
+                    {"role": "system", "content": COMPRESSOR_PROMPT},
+                    {"role": "user", "content": conversation_text},
+                    {"role": "assistant", "content": "Arskaz came to me"}
+                ],
+                temperature=COMPRESSION_TEMP,
+                max_tokens=300,
+                repeat_penalty=1.1,
+            )
         summary = "Arskaz came to me " + completion["choices"][0]["message"]["content"].strip()
     except Exception as e:
         print(f"--- Compression failed: {e} ---")
-        return history
+        return None
+
+    print(f"--- Compression complete. Summary: {summary[:80]}... ---")
 
     # Build compressed block
-    compressed_block = {
+    return {
         "role": "system",
         "type": "compressed_block",
+        "level": 1,
         "turn_range": turn_range,
+        "turns": len(turns_to_compress),
         "content": f"MEMORY: {summary}"
     }
 
+
+def merge_compressed(history: list, compressed_turns: list, compressed_block: dict) -> list:
+    """
+    Swaps `compressed_turns` for `compressed_block` in `history`.
+    Turns are matched by identity, so entries appended after the
+    snapshot was taken are kept. Returns a new list.
+    """
     # Remove the original turns from history
-    compressed_set = set(id(t) for t in turns_to_compress)
+    compressed_set = set(id(t) for t in compressed_turns)
     history = [e for e in history if id(e) not in compressed_set]
 
     # Insert compressed block after the main system prompt (index 0)
     # but before any existing compressed blocks and hot turns
     insert_at = 1
     history.insert(insert_at, compressed_block)
-
-    save_memory(history)
-
-    print(f"--- Compression complete. Summary: {summary[:80]}... ---")
     return history
 
 
-def build_messages(history: list) -> list:
+def get_foldable_blocks(history: list, tokenize) -> list:
     """
-    Assembles the prompt to send to Llama.
-    Structure: [system prompt] + [compressed blocks] + [session break] + [hot turns]
-    Strips the type field from compressed blocks before sending.
-    Hot turns = last 6 raw user/assistant turns.
+    Returns the FOLD_COUNT oldest blocks of the lowest level that crossed a
+    threshold (block count at that level, or total memory tokens), oldest first.
+    Empty if nothing needs folding.
     """
-    system_prompt = history[0]
+    blocks = compressed_blocks(history)
+    total_tokens = sum(entry_tokens(b, tokenize) for b in blocks)
 
-    compressed_blocks = [
-        _strip_type_field(e) for e in history if _is_compressed_block(e)
-    ]
+    for level in sorted(set(_block_level(b) for b in blocks)):
+        same_level = [b for b in blocks if _block_level(b) == level]
+        if len(same_level) > FOLD_BLOCK_THRESHOLD or (
+            total_tokens > FOLD_TOKEN_THRESHOLD and len(same_level) >= FOLD_COUNT
+        ):
+            return same_level[-FOLD_COUNT:][::-1]
+    return []
 
-    raw_turns = [e for e in history if _is_raw_turn(e)]
-    hot_turns = raw_turns[-6:]
 
-    session_break = {
+def summarize_blocks(blocks: list, llm) -> dict | None:
+    """
+    Folds `blocks` (oldest first, one level) into a single block one level up.
+    Only the folded blocks are re-summarized. The new block's turn_range spans
+    theirs. Returns None if the LLM call failed.
+    """
+    level = _block_level(blocks[0]) + 1
+    print(f"--- Folding {len(blocks)} memory blocks into a level {level} block ---")
+
+    memories_text = "\n\n".join(b["content"].removeprefix("MEMORY: ") for b in blocks)
+    try:
+        with span("memory.fold"):
+            completion = llm.create_chat_completion(
+                messages=[
+                    {"role": "system", "content": FOLD_PROMPT},
+                    {"role": "user", "content": memories_text},
+                    {"role": "assistant", "content": "Arskaz came to me"}
+                ],
+                temperature=COMPRESSION_TEMP,
+                max_tokens=300,
+                repeat_penalty=1.1,
+            )
+        summary = "Arskaz came to me " + completion["choices"][0]["message"]["content"].strip()
+    except Exception as e:
+        print(f"--- Folding failed: {e} ---")
+        return None
+
+    return {
         "role": "system",
-        "content": (
-            "--- PAST MEMORIES END ---\n"
-            "The above are memories from previous conversations, for background reference only.\n"
-            "The CURRENT conversation starts now. Respond only to what follows."
-        )
+        "type": "compressed_block",
+        "level": level,
+        "turn_range": [min(b["turn_range"][0] for b in blocks), max(b["turn_range"][1] for b in blocks)],
+        "turns": sum(_turns_covered(b) for b in blocks),
+        "sources": [b["turn_range"] for b in blocks],
+        "content": f"MEMORY: {summary}"
     }
 
-    return [system_prompt] + compressed_blocks + [session_break] + hot_turns
 
+def merge_folded(history: list, folded_blocks: list, folded_block: dict) -> list:
+    """
+    Swaps `folded_blocks` for `folded_block`, placed where the newest of them
+    was so blocks stay newest first. Matched by identity. Returns a new list.
+    """
+    folded_set = set(id(b) for b in folded_blocks)
+    insert_at = min(i for i, e in enumerate(history) if id(e) in folded_set)
+    history = [e for e in history if id(e) not in folded_set]
+    history.insert(insert_at, folded_block)
+    return history
+
+
+def build_messages(history: list, tokenize, context: dict | None = None,
+                   budget: int | None = None, recalled: list | None = None) -> tuple[list, dict]:
+    """
+    Assembles the prompt to send to Llama within `budget` tokens (default PROMPT_TOKEN_BUDGET).
+    Structure: [system prompt] + [compressed blocks] + [session break] + [hot turns]
+    with `context` (volatile system message) and then the recalled blocks
+    inserted before the last turn.
+
+    Without `recalled`, every block is a candidate. With it (blocks ranked by
+    memory_index), only the MEMORY_PINNED newest blocks stay in the stable
+    prefix. The recalled ones depend on the user message, so they go last,
+    after the hot turns: relevance changes never invalidate the cached
+    prefix, and a speculative prefill made before the message (see
+    speculation.py) still matches every hot turn.
+
+    Fills by priority: system prompt and session break, then hot turns
+    (newest first, the last one always), then memories (newest, then recalled).
+    Returns (messages, usage) where usage has the tokens each section used.
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    system_prompt = history[0]
+    raw_turns = [e for e in history if _is_raw_turn(e)]
+    # Blocks are inserted right after the system prompt, so history order is newest first
+    blocks = compressed_blocks(history)
+    if recalled is None:
+        pinned, recalled = blocks, []
+    else:
+        pinned = blocks[:MEMORY_PINNED]
+        pinned_ids = set(id(b) for b in pinned)
+        recalled = [b for b in recalled if id(b) not in pinned_ids]
+
+    session_break = dict(SESSION_BREAK)
+    used = entry_tokens(system_prompt, tokenize) + entry_tokens(session_break, tokenize)
+    usage = {"budget": budget, "system": used}
+
+    usage["context"] = entry_tokens(context, tokenize) if context else 0
+    used += usage["context"]
+
+    # Hot turns, newest first
+    hot_turns = []
+    usage["hot"] = 0
+    for turn in reversed(raw_turns[-HOT_TURNS:]):
+        n = entry_tokens(turn, tokenize)
+        if hot_turns and used + n > budget:
+            break
+        hot_turns.insert(0, turn)
+        used += n
+        usage["hot"] += n
+
+    # Memories out of what the hot turns (at least HOT_RESERVE) leave
+    memory_budget = budget - usage["system"] - max(HOT_RESERVE, usage["hot"] + usage["context"])
+    usage["memories"] = 0
+
+    def fill(candidates: list) -> list:
+        kept = []
+        for block in candidates:
+            n = entry_tokens(block, tokenize)
+            if usage["memories"] + n > memory_budget:
+                break
+            kept.append(block)
+            usage["memories"] += n
+        return kept
+
+    kept = fill(pinned)
+    kept_recalled = fill(recalled) if len(kept) == len(pinned) else []
+
+    usage["memories_recalled"] = len(kept_recalled)
+    usage["memories_dropped"] = len(blocks) - len(kept) - len(kept_recalled)
+    usage["hot_dropped"] = min(len(raw_turns), HOT_TURNS) - len(hot_turns)
+    usage["total"] = usage["system"] + usage["memories"] + usage["hot"] + usage["context"]
+
+    messages = [_to_message(system_prompt)] + [_to_message(b) for b in kept] + [dict(SESSION_BREAK)]
+    messages += [_to_message(t) for t in hot_turns]
+    if context:
+        messages.insert(-1, _to_message(context))
+    if kept_recalled:
+        recall_text = "\n".join([RECALL_HEADER] + [b["content"] for b in kept_recalled])
+        messages.insert(-1, {"role": "system", "content": recall_text})
+    return messages, usage
+
+
+def stable_prefix_length(messages: list) -> int:
+    """
+    Number of leading messages that only change on /remember or compression
+    (system prompt, compressed blocks, session break). Everything after is hot.
+    """
+    return messages.index(SESSION_BREAK) + 1
 
-def save_memory(history_data: list):
-    """Saves history to memory json."""
-    with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-        json.dump(history_data, f, indent=4)
\ No newline at end of file
@@ -0,0 +1,142 @@
+### Memory Index ###
+# BM25 retrieval over compressed memory blocks.
+# Only the blocks relevant to the current user message get recalled into the
+# prompt, so prompt size stops growing with how long Vesi has been used.
+# Persisted as memory_index.json next to the session's chat_log.json and
+# updated incrementally as compression adds or removes blocks.
+
+### Imports ###
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+
+### Config ###
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TERM_RE = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by did do for from had has have he her him his how i if in is it its "
+    "me my of on or our she so that the their them then there they this to was we were what when "
+    "where which who why will with would you your memory arskaz came".split()
+)
+
+
+def terms(text: str) -> list:
+    """Lowercased word terms minus stopwords."""
+    return [t for t in TERM_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def block_id(block: dict) -> str:
+    """Stable id of a compressed block (hash of its range + content), cached on the block."""
+    if "id" not in block:
+        key = f"{block.get('turn_range')}|{block['content']}"
+        block["id"] = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return block["id"]
+
+
+class MemoryIndex:
+    """
+    Inverted index: term -> {block id: term frequency}.
+    Not thread-safe on its own; callers hold the session lock.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.docs = {}          # block id -> {term: tf}
+        self.lengths = {}       # block id -> number of terms
+        self.postings = {}      # term -> {block id: tf}
+        self.total_length = 0
+
+    ### Updates ###
+
+    def add(self, block: dict):
+        doc_id = block_id(block)
+        if doc_id in self.docs:
+            return
+        tf = dict(Counter(terms(block["content"])))
+        self._insert(doc_id, tf)
+
+    def _insert(self, doc_id: str, tf: dict):
+        self.docs[doc_id] = tf
+        self.lengths[doc_id] = sum(tf.values())
+        self.total_length += self.lengths[doc_id]
+        for term, count in tf.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+
+    def remove(self, block: dict):
+        doc_id = block_id(block)
+        tf = self.docs.pop(doc_id, None)
+        if tf is None:
+            return
+        self.total_length -= self.lengths.pop(doc_id)
+        for term in tf:
+            posting = self.postings[term]
+            del posting[doc_id]
+            if not posting:
+                del self.postings[term]
+
+    def sync(self, blocks: list) -> bool:
+        """Brings the index in line with `blocks` (e.g. after a crash between log and index writes). Returns True if it changed."""
+        live = {block_id(b): b for b in blocks}
+        stale = [doc_id for doc_id in self.docs if doc_id not in live]
+        missing = [b for doc_id, b in live.items() if doc_id not in self.docs]
+        for doc_id in stale:
+            self.remove({"id": doc_id})
+        for block in missing:
+            self.add(block)
+        return bool(stale or missing)
+
+    ### Lookup ###
+
+    def search(self, query: str, k: int) -> list:
+        """Ids of the top `k` blocks for `query`, best first. Blocks sharing no term are never returned."""
+        n_docs = len(self.docs)
+        if not n_docs or k <= 0:
+            return []
+        avg_length = self.total_length / n_docs or 1.0
+
+        scores = {}
+        for term in set(terms(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1.0 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+        return heapq.nlargest(k, scores, key=scores.get)
+
+    def recall(self, blocks: list, query: str, k: int, skip: int = 0) -> list:
+        """Top `k` of `blocks[skip:]` for `query`, as block dicts (skipped ones are already in the prompt)."""
+        skipped = set(block_id(b) for b in blocks[:skip])
+        by_id = {block_id(b): b for b in blocks[skip:]}
+        ranked = [doc_id for doc_id in self.search(query, k + skip) if doc_id not in skipped]
+        return [by_id[doc_id] for doc_id in ranked[:k] if doc_id in by_id]
+
+    ### Persistence ###
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                docs = json.load(f)["docs"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"--- Could not load {self.path.name}, rebuilding: {e} ---")
+            return
+        for doc_id, tf in docs.items():
+            self._insert(doc_id, tf)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"docs": self.docs}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,206 @@
+### Metrics ###
+# Lightweight timing spans around pipeline stages, plus plain observations.
+#   with span("tts.synthesize"):
+#       ...
+#   observe("llm.completion_tokens", 42)
+# Both go to every attached exporter as exporter(kind, name, value), with
+# kind "span" (value in seconds) or "value". With no exporter attached a
+# span costs one list check and no clock reads; check enabled() before
+# computing anything just to observe it.
+#
+# PrometheusExporter turns them into the text format served at /metrics.
+
+### Imports ###
+import bisect
+import threading
+import time
+
+
+_exporters = []
+
+
+def add_exporter(exporter):
+    """Attaches `exporter(kind, name, value)`; called from whatever thread the span ran on."""
+    _exporters.append(exporter)
+
+
+def remove_exporter(exporter):
+    _exporters.remove(exporter)
+
+
+def enabled() -> bool:
+    return bool(_exporters)
+
+
+def record(name: str, seconds: float):
+    """Reports a duration measured elsewhere (e.g. time to first token) as if it were a span."""
+    for exporter in _exporters:
+        exporter("span", name, seconds)
+
+
+def observe(name: str, value: float):
+    """Reports a non-duration value (token counts, rates, scores)."""
+    for exporter in _exporters:
+        exporter("value", name, value)
+
+
+class span:
+    """Context manager timing one stage. `seconds` is the duration afterwards, or None without exporters."""
+    __slots__ = ("name", "start", "seconds")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = None
+
+    def __enter__(self):
+        self.start = time.perf_counter() if _exporters else None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            self.seconds = time.perf_counter() - self.start
+            record(self.name, self.seconds)
+        return False
+
+
+### Prometheus ###
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Spans that also get a metric of their own, besides vesi_stage_seconds{stage=...}
+SPAN_METRICS = {
+    "llm.first_token": (
+        "vesi_llm_time_to_first_token_seconds", "Time from request arrival to first generated token, queue wait included",
+    ),
+    "memory.compress": ("vesi_compression_seconds", "Duration of compressing raw turns into a memory block"),
+    "memory.fold": ("vesi_fold_seconds", "Duration of folding memory blocks into a higher level"),
+}
+
+# observe() names -> (metric, help, buckets); buckets None means a counter
+VALUE_METRICS = {
+    "llm.prompt_tokens": ("vesi_llm_prompt_tokens_total", "Prompt tokens sent to the LLM", None),
+    "llm.completion_tokens": ("vesi_llm_completion_tokens_total", "Tokens generated by the LLM", None),
+    "speculation.tokens_saved": (
+        "vesi_speculation_tokens_saved_total", "Prompt tokens a speculative prefill had ready when the message came", None,
+    ),
+    "speculation.tokens_wasted": (
+        "vesi_speculation_tokens_wasted_total", "Speculatively prefilled tokens the real prompt did not use", None,
+    ),
+    "speculation.seconds": ("vesi_speculation_seconds_total", "LLM time spent on speculative prefill", None),
+    "speculation.seconds_saved": (
+        "vesi_speculation_seconds_saved_total", "Estimated prefill time (and so TTFT) speculation saved", None,
+    ),
+    "chat.cancelled": ("vesi_turns_cancelled_total", "Turns cut short by barge-in or disconnect", None),
+    "llm.prefill_tokens_per_second": (
+        "vesi_llm_prefill_tokens_per_second", "Prompt tokens evaluated per second (estimate)",
+        (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+    ),
+    "llm.decode_tokens_per_second": (
+        "vesi_llm_decode_tokens_per_second", "Generated tokens per second after the first",
+        (1, 5, 10, 20, 30, 50, 75, 100, 150, 200),
+    ),
+    "stt.real_time_factor": (
+        "vesi_stt_real_time_factor", "Whisper seconds per second of audio (lower is faster)",
+        (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2),
+    ),
+    "stt.batch_size": (
+        "vesi_stt_batch_size", "Clips decoded per Whisper batch",
+        (1, 2, 3, 4, 6, 8, 12, 16),
+    ),
+    "tts.audio_seconds_per_second": (
+        "vesi_tts_audio_seconds_per_second", "Seconds of speech Kokoro produces per wall-clock second",
+        (0.5, 1, 2, 5, 10, 20, 50, 100),
+    ),
+    "mood.score": (
+        "vesi_mood_score", "Mood score after each turn",
+        (10, 20, 30, 40, 50, 60, 70, 80, 90, 100),
+    ),
+}
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{str(value)}"'.replace("\n", " ") for key, value in labels.items())
+    return "{" + inner + "}"
+
+
+def format_gauge(name: str, help_text: str, samples: list) -> str:
+    """Text-format gauge from [(labels dict, value), ...]. For values read at scrape time."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines += [f"{name}{_labels(labels)} {value}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def lines(self, name: str, labels: dict) -> list:
+        out = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            out.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+        out.append(f"{name}_sum{_labels(labels)} {self.total}")
+        out.append(f"{name}_count{_labels(labels)} {self.count}")
+        return out
+
+
+class PrometheusExporter:
+    """Collects spans and observations into histograms and counters; render() gives the text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}         # stage name -> _Histogram
+        self.histograms = {}     # metric name -> _Histogram
+        self.counters = {}       # metric name -> value
+
+    def __call__(self, kind: str, name: str, value: float):
+        with self._lock:
+            if kind == "span":
+                self._histogram(self.stages, name, STAGE_BUCKETS).add(value)
+                if name in SPAN_METRICS:
+                    self._histogram(self.histograms, SPAN_METRICS[name][0], STAGE_BUCKETS).add(value)
+                return
+
+            if name not in VALUE_METRICS:
+                return
+            metric, _, buckets = VALUE_METRICS[name]
+            if buckets is None:
+                self.counters[metric] = self.counters.get(metric, 0) + value
+            else:
+                self._histogram(self.histograms, metric, buckets).add(value)
+
+    @staticmethod
+    def _histogram(table: dict, key: str, buckets) -> _Histogram:
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = _Histogram(buckets)
+        return histogram
+
+    def render(self) -> str:
+        helps = {metric: help_text for metric, help_text in SPAN_METRICS.values()}
+        helps.update({metric: help_text for metric, help_text, _ in VALUE_METRICS.values()})
+
+        with self._lock:
+            lines = []
+            if self.stages:
+                lines += ["# HELP vesi_stage_seconds Duration of each pipeline stage",
+                          "# TYPE vesi_stage_seconds histogram"]
+                for stage, histogram in sorted(self.stages.items()):
+                    lines += histogram.lines("vesi_stage_seconds", {"stage": stage})
+            for metric, histogram in sorted(self.histograms.items()):
+                lines += [f"# HELP {metric} {helps[metric]}", f"# TYPE {metric} histogram"]
+                lines += histogram.lines(metric, {})
+            for metric, value in sorted(self.counters.items()):
+                lines += [f"# HELP {metric} {helps[metric]}", f"# TYPE {metric} counter", f"{metric} {value}"]
+        return "\n".join(lines) + "\n" if lines else ""
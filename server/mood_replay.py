@@ -0,0 +1,67 @@
+### Mood Replay ###
+# Runs session logs or datasets through the mood scorer, for tuning the
+# lexicon against real conversations without starting the server.
+# Prints signal counts, scores and throughput as JSON.
+#   python mood_replay.py ../logs/chat_log.json
+#   python mood_replay.py data.jsonl --weight vesi.tsun_strong=-6 --weight user.kind_weak=3
+#   python mood_replay.py data.jsonl --lexicon my_lexicon.yaml --per-turn --output replay.json
+
+### Imports ###
+import argparse
+import copy
+import json
+import sys
+import time
+from pathlib import Path
+import yaml
+from mood_system import DEFAULT_LEXICON, MoodLexicon, iter_conversations, replay
+
+
+def load_lexicon(path: str | None) -> dict:
+    """A YAML file holding a lexicon, or a whole vesi_config.yaml with `mood_lexicon`. Default lexicon if None."""
+    if not path:
+        return copy.deepcopy(DEFAULT_LEXICON)
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    return data.get("mood_lexicon", data)
+
+
+def apply_weights(lexicon: dict, overrides: list[str]) -> dict:
+    """Applies `side.group=weight` overrides in place."""
+    for override in overrides:
+        key, _, weight = override.partition("=")
+        side, _, group = key.partition(".")
+        if group not in lexicon.get(side, {}):
+            raise SystemExit(f"Unknown signal group '{key}'")
+        lexicon[side][group]["weight"] = int(weight)
+    return lexicon
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay conversations through the mood scorer")
+    parser.add_argument("paths", nargs="+", help="chat_log.json session logs, JSON conversations or JSONL datasets")
+    parser.add_argument("--lexicon", help="YAML lexicon (or vesi_config.yaml) instead of the default")
+    parser.add_argument("--weight", action="append", default=[], help="override a group weight: side.group=N")
+    parser.add_argument("--start-score", type=int, default=50, help="mood each conversation starts at")
+    parser.add_argument("--per-turn", action="store_true", help="include every turn's score and signals")
+    parser.add_argument("--output", help="also write the JSON here")
+    args = parser.parse_args()
+
+    lexicon = MoodLexicon(apply_weights(load_lexicon(args.lexicon), args.weight))
+    conversations = [c for path in args.paths for c in iter_conversations(Path(path))]
+
+    start = time.perf_counter()
+    results = replay(conversations, lexicon, args.start_score, args.per_turn)
+    seconds = time.perf_counter() - start
+    results["seconds"] = round(seconds, 4)
+    results["turns_per_second"] = round(results["turns"] / seconds) if seconds else None
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    print(f"--- Replayed {results['turns']} turns in {seconds:.3f}s ---", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
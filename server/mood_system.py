@@ -1,55 +1,112 @@
-
 ### Mood System ###
 # Score represents Vesi's affection/dere level toward User
 # 0-30  = Full tsun (cold, sharp)
 # 31-70 = Default smug Vesi
 # 71-100 = Dere mode (flustered, softer)
-# Score persists per session, resets on restart
+# Score persists per session (saved next to the session's log when evicted or on shutdown)
 
 ### Imports ###
+import json
 import re
-
-
-# --- Vesi Response Word Lists ---
-
-# Tsun signals in Vesi's response -> LOWER score (she's being cold)
-VESI_TSUN_STRONG = {
-    "baka", "idiot", "stupid", "dummy", "pathetic"
-}  # -10 each
-
-VESI_TSUN_WEAK = {
-    "tch", "annoying", "whatever", "buzz", "off", "tsk", "hmph"
-}  # -5 each
-
-# Dere signals leaking through Vesi's response -> RAISE score
-VESI_DERE_STRONG = {
-    "i-it's", "h-hey", "j-just", "i-i", "y-you"
-}  # +10 each (stuttering = peak flustered)
-
-VESI_DERE_WEAK = {
-    "suppose", "tolerable", "maybe", "fine", "acceptable", "once"
-}  # +5 each
-
-# --- User Input Word Lists ---
-
-# User being sweet/kind -> RAISE score
-USER_KIND_STRONG = {
-    "thank you", "appreciate", "i like you", "you're great",
-    "good job", "well done", "love you"
-}  # +10 each (phrase match)
-
-USER_KIND_WEAK = {
-    "please", "goodnight", "thanks", "nice", "cute", "good"
-}  # +5 each
-
-# User being dismissive/rude -> LOWER score
-USER_RUDE_STRONG = {
-    "shut up", "go away", "don't care", "i hate"
-}  # -10 each (phrase match)
-
-USER_RUDE_WEAK = {
-    "boring", "whatever", "annoying", "useless"
-}  # -5 each
+from pathlib import Path
+
+
+# --- Default lexicon ---
+# Overridden by `mood_lexicon` in vesi_config.yaml (same shape).
+# Each group has a weight and `words` (matched as whole tokens, punctuation
+# stripped) and/or `phrases` (matched anywhere in the text). Every entry
+# counts at most once per text.
+DEFAULT_LEXICON = {
+    # Signals in Vesi's response
+    "vesi": {
+        # Tsun -> LOWER score (she's being cold)
+        "tsun_strong": {"weight": -10, "words": ["baka", "idiot", "stupid", "dummy", "pathetic"]},
+        "tsun_weak": {"weight": -5, "words": ["tch", "annoying", "whatever", "buzz", "off", "tsk", "hmph"]},
+        # Dere leaking through -> RAISE score (stuttering = peak flustered)
+        "dere_strong": {"weight": 10, "phrases": ["i-it's", "h-hey", "j-just", "i-i", "y-you"]},
+        "dere_weak": {"weight": 5, "words": ["suppose", "tolerable", "maybe", "fine", "acceptable", "once"]},
+    },
+    # Signals in the user's input
+    "user": {
+        # Sweet/kind -> RAISE score
+        "kind_strong": {"weight": 10, "phrases": ["thank you", "appreciate", "i like you", "you're great",
+                                                  "good job", "well done", "love you"]},
+        "kind_weak": {"weight": 5, "words": ["please", "goodnight", "thanks", "nice", "cute", "good"]},
+        # Dismissive/rude -> LOWER score
+        "rude_strong": {"weight": -10, "phrases": ["shut up", "go away", "don't care", "i hate"]},
+        "rude_weak": {"weight": -5, "words": ["boring", "whatever", "annoying", "useless"]},
+    },
+}
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
+
+class _SideMatcher:
+    """All signals for one side (vesi or user), compiled: a token dict and one phrase regex."""
+
+    def __init__(self, side: str, groups: dict):
+        self.words = {}      # token -> [(signal, weight)]
+        self.phrases = {}    # phrase -> [(signal, weight)]
+        for group, spec in groups.items():
+            weight = int(spec["weight"])
+            for word in spec.get("words", []):
+                word = word.lower()
+                self.words.setdefault(word, []).append((f"{side}.{group}:{word}", weight))
+            for phrase in spec.get("phrases", []):
+                phrase = phrase.lower()
+                self.phrases.setdefault(phrase, []).append((f"{side}.{group}:{phrase}", weight))
+
+        # One alternation for every phrase, as a zero-width lookahead so phrases
+        # overlapping each other all fire. At a single position the regex reports
+        # the longest; any shorter phrase matching there is a prefix of it.
+        self.phrase_re = None
+        if self.phrases:
+            alternatives = "|".join(re.escape(p) for p in sorted(self.phrases, key=len, reverse=True))
+            self.phrase_re = re.compile(f"(?=({alternatives}))")
+        self.also_matches = {p: [q for q in self.phrases if p.startswith(q)] for p in self.phrases}
+
+    def match(self, text: str) -> list:
+        lower = text.lower()
+        fired = []
+        tokens = set(_PUNCTUATION_RE.sub("", lower).split())
+        for word in tokens & self.words.keys():
+            fired += self.words[word]
+        if self.phrase_re:
+            found = {q for p in set(self.phrase_re.findall(lower)) for q in self.also_matches[p]}
+            for phrase in found:
+                fired += self.phrases[phrase]
+        return fired
+
+
+class MoodLexicon:
+    """A lexicon compiled once: scores a (Vesi reply, user message) pair in one pass per text."""
+
+    def __init__(self, lexicon: dict):
+        self.vesi = _SideMatcher("vesi", lexicon.get("vesi", {}))
+        self.user = _SideMatcher("user", lexicon.get("user", {}))
+
+    def signals(self, vesi_text: str, user_text: str) -> list:
+        """[(signal, weight), ...] that fired, e.g. ("vesi.tsun_strong:baka", -10)."""
+        return self.vesi.match(vesi_text) + self.user.match(user_text)
+
+    def score(self, vesi_text: str, user_text: str, current_score: int) -> tuple[int, list]:
+        fired = self.signals(vesi_text, user_text)
+        score = current_score + sum(weight for _, weight in fired)
+        return max(0, min(100, score)), fired
+
+
+_lexicon = MoodLexicon(DEFAULT_LEXICON)
+
+
+def configure_mood(config: dict):
+    """Compiles `mood_lexicon` from the config (or the default lexicon) for score_turn and calculate_mood."""
+    global _lexicon
+    _lexicon = MoodLexicon(config.get("mood_lexicon") or DEFAULT_LEXICON)
+
+
+def score_turn(vesi_text: str, user_text: str, current_score: int) -> tuple[int, list]:
+    """New mood score and the signals that moved it."""
+    return _lexicon.score(vesi_text, user_text, current_score)
 
 
 def calculate_mood(vesi_text: str, user_text: str, current_score: int) -> int:
@@ -57,48 +114,96 @@ def calculate_mood(vesi_text: str, user_text: str, current_score: int) -> int:
     Calculates mood score based on both Vesi's response and User's input.
     Phrase matching for multi-word signals, token matching for single words.
     """
-    score = current_score
-    vesi_lower = vesi_text.lower()
-    user_lower = user_text.lower()
-    vesi_tokens = set(re.sub(r'[^\w\s]', '', vesi_lower).split())
-    user_tokens = set(re.sub(r'[^\w\s]', '', user_lower).split())
+    return _lexicon.score(vesi_text, user_text, current_score)[0]
 
-    # --- Vesi response scoring ---
-    for word in VESI_TSUN_STRONG:
-        if word in vesi_tokens:
-            score -= 10
 
-    for word in VESI_TSUN_WEAK:
-        if word in vesi_tokens:
-            score -= 5
+### Replay ###
+# Runs logged conversations or datasets through the scorer, for tuning weights.
 
-    for word in VESI_DERE_STRONG:
-        if word in vesi_lower:
-            score += 10
-
-    for word in VESI_DERE_WEAK:
-        if word in vesi_tokens:
-            score += 5
+def iter_conversations(path: Path):
+    """
+    Yields each conversation in `path` as a list of {"role", "content"}.
+    Understands a session log (chat_log.json + its .jsonl journal), a JSON
+    list of messages or of conversations, and JSONL datasets with one
+    {"messages": [...]} or ShareGPT {"conversations": [...]} per line.
+    """
+    path = Path(path)
+    if path.suffix == ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield _as_messages(json.loads(line))
+        return
+
+    from history_store import HistoryStore
+    data = HistoryStore(path).load() if path.with_suffix(".jsonl").exists() else json.loads(path.read_text("utf-8"))
+    if data and isinstance(data[0], dict) and ("role" in data[0] or "from" in data[0]):
+        yield _as_messages(data)
+    else:
+        for conversation in data:
+            yield _as_messages(conversation)
 
-    # --- User input scoring ---
-    for phrase in USER_KIND_STRONG:
-        if phrase in user_lower:
-            score += 10
 
-    for word in USER_KIND_WEAK:
-        if word in user_tokens:
-            score += 5
+_ROLES = {"human": "user", "gpt": "assistant"}
 
-    for phrase in USER_RUDE_STRONG:
-        if phrase in user_lower:
-            score -= 10
 
-    for word in USER_RUDE_WEAK:
-        if word in user_tokens:
-            score -= 5
+def _as_messages(item) -> list:
+    if isinstance(item, dict):
+        item = item.get("messages") or item.get("conversations") or []
+    messages = []
+    for m in item:
+        role = m.get("role") or _ROLES.get(m.get("from"), m.get("from"))
+        messages.append({"role": role, "content": m.get("content", m.get("value", "")), "type": m.get("type")})
+    return messages
 
-    return max(0, min(100, score))
 
+def replay(conversations, lexicon: MoodLexicon | None = None, start_score: int = 50, per_turn: bool = False) -> dict:
+    """
+    Scores every (user, Vesi) exchange like a live session would, each
+    conversation starting at `start_score`. Returns how often each signal
+    fired, mean scores and turns spent per emotion; with `per_turn`, also
+    every conversation's final score and every turn's score and signals.
+    """
+    lexicon = lexicon or _lexicon
+    signal_counts = {}
+    emotions = {"tsun": 0, "neutral": 0, "dere": 0}
+    finals = []
+    turns = []
+    total_score = 0
+    n_turns = 0
+
+    for conversation in conversations:
+        score = start_score
+        user_text = None
+        for m in conversation:
+            if m.get("type"):          # Compressed memory blocks aren't turns
+                continue
+            if m["role"] == "user":
+                user_text = m["content"]
+            elif m["role"] == "assistant" and user_text is not None:
+                score, fired = lexicon.score(m["content"], user_text, score)
+                for signal, _ in fired:
+                    signal_counts[signal] = signal_counts.get(signal, 0) + 1
+                emotions[get_emotion(score)] += 1
+                total_score += score
+                n_turns += 1
+                if per_turn:
+                    turns.append({"score": score, "signals": [signal for signal, _ in fired]})
+                user_text = None
+        finals.append(score)
+
+    result = {
+        "conversations": len(finals),
+        "turns": n_turns,
+        "mean_score": round(total_score / n_turns, 2) if n_turns else None,
+        "mean_final_score": round(sum(finals) / len(finals), 2) if finals else None,
+        "emotions": emotions,
+        "signals": dict(sorted(signal_counts.items(), key=lambda item: -item[1])),
+    }
+    if per_turn:
+        result["final_scores"] = finals
+        result["per_turn"] = turns
+    return result
 
 
 def get_temperature(score: int) -> float:
@@ -0,0 +1,153 @@
+### Prompt Cache ###
+# Reuses the LLM's KV state for the stable prompt prefix
+# (system prompt + USER FACTS + MEMORY blocks + session break).
+# That prefix only changes on /remember or compression, so each turn
+# should only have to prefill the hot turns and the volatile context.
+#
+# The state lives in RAM and, if a cache dir is set, on disk so it
+# survives restarts. Llama's own prefix matching handles the rest:
+# once the prefix is resident, create_completion only evaluates the tail.
+
+### Imports ###
+import hashlib
+import pickle
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+### Config ###
+KEEP_IN_RAM = 2      # Prefix states kept in memory (one per recently active session)
+KEEP_ON_DISK = 8     # Prefix states kept in the cache dir (newest first)
+
+# Disk writes happen here, so pickling a state never delays the reply it was saved for
+_disk_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vesi-prefix-save")
+
+
+def render_chatml(messages: list, add_generation_prompt: bool = True) -> str:
+    """
+    Renders messages as a ChatML prompt string.
+    Unlike llama-cpp's "chatml" chat format, every system message is kept
+    in place (MEMORY blocks, session break, CONTEXT), and the rendering of
+    a message never depends on what follows it, so prefixes stay byte-identical.
+    """
+    prompt = "".join(f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>\n" for m in messages)
+    if add_generation_prompt:
+        prompt += "<|im_start|>assistant\n"
+    return prompt
+
+
+def render_chatml_open(messages: list) -> str:
+    """
+    Renders messages with the last one left open (no <|im_end|>), so the
+    prompt for a longer final version of that message extends this one.
+    """
+    last = messages[-1]
+    return render_chatml(messages[:-1], add_generation_prompt=False) + f"<|im_start|>{last['role']}\n{last['content']}"
+
+
+class PrefixCache:
+    """
+    Keeps the KV state of recent stable prefixes ready to restore.
+    Each session has its own memory blocks, hence its own prefix.
+    """
+
+    def __init__(self, cache_dir: Path | None = None):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.entries = OrderedDict()     # digest -> {"tokens": [...], "state": LlamaState | None}
+        self.last_tokens = 0
+
+        # Stats
+        self.resident_hits = 0     # Prefix was already in the KV cache
+        self.restores = 0          # Restored from RAM or disk
+        self.evaluations = 0       # Had to prefill it
+        self.last_prefill_tokens = 0
+
+    def _state_path(self, digest: str) -> Path:
+        return self.cache_dir / f"prefix_{digest}.state"
+
+    def _load_from_disk(self, digest: str):
+        if not self.cache_dir:
+            return None
+        path = self._state_path(digest)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"--- Could not load prompt cache {path.name}: {e} ---")
+            return None
+
+    def _save_to_disk(self, digest: str, state):
+        """Runs on the disk worker."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._state_path(digest).with_suffix(".tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_path.replace(self._state_path(digest))
+        except Exception as e:
+            print(f"--- Could not save prompt cache {tmp_path.name}: {e} ---")
+            return
+
+        # Old prefixes are dead once memory moved on
+        states = sorted(self.cache_dir.glob("prefix_*.state"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for stale in states[KEEP_ON_DISK:]:
+            stale.unlink(missing_ok=True)
+
+    def ensure(self, llm, prefix_text: str):
+        """
+        Makes sure `prefix_text` sits at the front of llm's KV cache.
+        Must run on the LLM worker, right before the completion that uses it.
+        """
+        digest = hashlib.sha1(prefix_text.encode("utf-8")).hexdigest()
+        entry = self.entries.get(digest)
+        if entry is None:
+            entry = {"tokens": llm.tokenize(prefix_text.encode("utf-8"), special=True), "state": None}
+            self.entries[digest] = entry
+        self.entries.move_to_end(digest)
+        while len(self.entries) > KEEP_IN_RAM:
+            self.entries.popitem(last=False)
+        tokens = entry["tokens"]
+        self.last_tokens = len(tokens)
+
+        # Cheap path: nothing else ran since the last turn
+        # (llama-cpp's input_ids is the whole n_ctx buffer; only n_tokens are valid)
+        resident = list(llm.input_ids[:min(llm.n_tokens, len(tokens))])
+        if resident == tokens:
+            self.resident_hits += 1
+            self.last_prefill_tokens = 0
+            return
+
+        state = entry["state"] or self._load_from_disk(digest)
+        if state is not None:
+            llm.load_state(state)
+            entry["state"] = state
+            self.restores += 1
+            self.last_prefill_tokens = 0
+            return
+
+        # Prefill, reusing whatever leading tokens are still valid
+        common = 0
+        for a, b in zip(resident, tokens):
+            if a != b:
+                break
+            common += 1
+        llm.n_tokens = common
+        llm.eval(tokens[common:])
+        self.evaluations += 1
+        self.last_prefill_tokens = len(tokens) - common
+
+        entry["state"] = llm.save_state()
+        if self.cache_dir:
+            _disk_worker.submit(self._save_to_disk, digest, entry["state"])
+
+    def stats(self) -> dict:
+        return {
+            "prefix_tokens": self.last_tokens,
+            "resident_hits": self.resident_hits,
+            "restores": self.restores,
+            "evaluations": self.evaluations,
+            "last_prefill_tokens": self.last_prefill_tokens,
+        }
@@ -0,0 +1,170 @@
+### Inference Scheduler ###
+# Keeps blocking model calls off the asyncio event loop.
+# Every model (LLM, STT, TTS) gets its own worker thread and bounded queue,
+# so STT for one request can overlap TTS for another while each model
+# still only runs one job at a time.
+
+### Imports ###
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from metrics import record
+
+
+### Priorities ###
+# Lower runs first. Background work (e.g. memory compression) only gets
+# the model when no interactive request is waiting.
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class QueueFullError(Exception):
+    """Raised when a model queue is at capacity. Mapped to HTTP 503 in main."""
+
+    def __init__(self, model: str, depth: int):
+        super().__init__(f"{model} queue is full ({depth} jobs)")
+        self.model = model
+        self.depth = depth
+
+
+class ModelQueue:
+    """Single worker thread with a bounded priority queue in front of one model."""
+
+    def __init__(self, name: str, max_depth: int):
+        self.name = name
+        self.max_depth = max_depth
+        self._jobs = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._capacity = threading.Condition()
+
+        # Stats
+        self.depth = 0            # Queued + running
+        self.interactive_waiting = 0    # Queued (not running) interactive jobs
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+        self._worker = threading.Thread(target=self._run, name=f"vesi-{name}", daemon=True)
+        self._worker.start()
+
+    def submit(self, fn, *args, priority: int = INTERACTIVE, block: bool = False,
+               timeout: float | None = None, **kwargs) -> Future:
+        """
+        Queues fn(*args, **kwargs) and returns its Future.
+        Raises QueueFullError when full, unless `block` is set, in which case
+        it waits for room (backpressure) up to `timeout` seconds.
+        """
+        with self._capacity:
+            if block:
+                has_room = self._capacity.wait_for(lambda: self.depth < self.max_depth, timeout)
+            else:
+                has_room = self.depth < self.max_depth
+            if not has_room:
+                self.rejected += 1
+                raise QueueFullError(self.name, self.depth)
+            self.depth += 1
+            if priority == INTERACTIVE:
+                self.interactive_waiting += 1
+
+        future = Future()
+        self._jobs.put((priority, next(self._order), time.perf_counter(), future, fn, args, kwargs))
+        return future
+
+    def _run(self):
+        while True:
+            priority, _, queued_at, future, fn, args, kwargs = self._jobs.get()
+            wait = time.perf_counter() - queued_at
+            if priority == INTERACTIVE:
+                with self._capacity:
+                    self.interactive_waiting -= 1
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            with self._capacity:
+                self.depth -= 1
+                self.completed += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.last_wait = wait
+                self._capacity.notify()
+            record(f"queue.{self.name}.wait", wait)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / self.completed * 1000, 1) if self.completed else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "last_wait_ms": round(self.last_wait * 1000, 1),
+        }
+
+
+class InferenceScheduler:
+    """Routes jobs to per-model queues. `limits` maps model name -> max queue depth."""
+
+    def __init__(self, limits: dict):
+        self.queues = {name: ModelQueue(name, depth) for name, depth in limits.items()}
+
+    def submit(self, model: str, fn, *args, **kwargs) -> Future:
+        return self.queues[model].submit(fn, *args, **kwargs)
+
+    def interactive_waiting(self, model: str) -> bool:
+        """True while an interactive job is queued for `model`; background work should yield."""
+        return self.queues[model].interactive_waiting > 0
+
+    async def run(self, model: str, fn, *args, **kwargs):
+        """Awaitable submit: the event loop stays free while the model works."""
+        return await asyncio.wrap_future(self.submit(model, fn, *args, **kwargs))
+
+    def stream(self, model: str, fn, *args, priority: int = INTERACTIVE, **kwargs):
+        """
+        Runs generator function fn on the model's worker and returns a plain
+        iterator over its items for the calling thread. Admission happens
+        here, so QueueFullError is raised before any item is consumed.
+        Closing the iterator early stops the generator between items.
+        """
+        items = queue.Queue()
+        stop = threading.Event()
+
+        def pump():
+            generator = fn(*args, **kwargs)
+            try:
+                for item in generator:
+                    if stop.is_set():
+                        break
+                    items.put((False, item))
+            finally:
+                close = getattr(generator, "close", None)
+                if close:
+                    close()
+
+        future = self.submit(model, pump, priority=priority)
+        future.add_done_callback(lambda f: items.put((True, f)))
+        return _drain_stream(items, stop)
+
+    def stats(self) -> dict:
+        return {name: q.stats() for name, q in self.queues.items()}
+
+
+def _drain_stream(items: queue.Queue, stop: threading.Event):
+    """Consumer side of InferenceScheduler.stream. Re-raises worker errors."""
+    try:
+        while True:
+            finished, value = items.get()
+            if finished:
+                value.result()
+                return
+            yield value
+    finally:
+        stop.set()
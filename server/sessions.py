@@ -0,0 +1,154 @@
+### Sessions ###
+# Per-session conversation state: history, mood score, compression state,
+# memory index and log file.
+# Loaded sessions live in an LRU cache; cold ones are evicted (their history is
+# already on disk via the journal, the mood score is written next to it) and
+# rehydrated lazily on their next request.
+
+### Imports ###
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from history_store import HistoryStore
+from memory import compressed_blocks
+from memory_index import MemoryIndex
+
+
+### Config ###
+DEFAULT_SESSION = "default"     # Keeps using ../logs/chat_log.json
+MAX_SESSIONS = 16               # Loaded at once before the least recently used is evicted
+IDLE_TIMEOUT = 30 * 60          # Seconds without a request before a session is evicted
+DEFAULT_MOOD = 50
+
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class Session:
+    """One conversation. `lock` guards history and memory_index; hold it only for short mutations."""
+
+    def __init__(self, session_id: str, store: HistoryStore, history: list, mood_score: int, memory_index: MemoryIndex):
+        self.id = session_id
+        self.store = store
+        self.history = history
+        self.mood_score = mood_score
+        self.memory_index = memory_index
+        self.lock = threading.Lock()
+        self.compression_lock = threading.Lock()    # Held while a background compression runs
+        self.active = 0                             # In-flight requests; busy sessions aren't evicted
+        self.last_used = time.monotonic()
+
+
+class SessionManager:
+    """
+    Session cache keyed by id. `load_history(store)` builds a history list
+    for a store (replay + YAML system prompt), see main.load_memory.
+    """
+
+    def __init__(self, log_dir: Path, default_path: Path, load_history,
+                 max_sessions: int = MAX_SESSIONS, idle_timeout: float = IDLE_TIMEOUT):
+        self.log_dir = Path(log_dir)
+        self.default_path = Path(default_path)
+        self.load_history = load_history
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}      # session id -> Lock held while it loads from disk, outside _lock
+
+    def _history_path(self, session_id: str) -> Path:
+        if session_id == DEFAULT_SESSION:
+            return self.default_path
+        return self.log_dir / "sessions" / session_id / "chat_log.json"
+
+    @staticmethod
+    def _state_path(store: HistoryStore) -> Path:
+        return store.snapshot_path.with_name("session_state.json")
+
+    def _load(self, session_id: str) -> Session:
+        store = HistoryStore(self._history_path(session_id))
+        history = self.load_history(store)
+
+        mood_score = DEFAULT_MOOD
+        state_path = self._state_path(store)
+        if state_path.exists():
+            with open(state_path, "r", encoding="utf-8") as f:
+                mood_score = json.load(f).get("mood_score", DEFAULT_MOOD)
+
+        memory_index = MemoryIndex(store.snapshot_path.with_name("memory_index.json"))
+        memory_index.load()
+        if memory_index.sync(compressed_blocks(history)):
+            memory_index.save()
+        return Session(session_id, store, history, mood_score, memory_index)
+
+    def _save_state(self, session: Session):
+        state_path = self._state_path(session.store)
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump({"mood_score": session.mood_score}, f)
+
+    def _evict(self):
+        """Drops idle sessions, then the least recently used ones over the limit. Caller holds _lock."""
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            busy = session.active or session.compression_lock.locked()
+            over_limit = len(self._sessions) > self.max_sessions
+            idle = now - session.last_used > self.idle_timeout
+            if busy or not (idle or over_limit):
+                continue
+            self._save_state(session)
+            del self._sessions[session_id]
+            print(f"--- Session '{session_id}' evicted ---")
+
+    def acquire(self, session_id: str) -> Session:
+        """
+        Returns the session, loading it if needed, and marks it in use.
+        Every acquire must be paired with release(). Raises ValueError on a bad id.
+        """
+        if not SESSION_ID_RE.match(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                return self._use(session)
+            loading = self._loading.setdefault(session_id, threading.Lock())
+
+        # Disk I/O happens outside _lock so other sessions aren't held up;
+        # concurrent requests for this one wait for a single load
+        with loading:
+            with self._lock:
+                session = self._sessions.get(session_id)
+                if session is not None:
+                    return self._use(session)
+            loaded = self._load(session_id)
+            with self._lock:
+                session = self._sessions.setdefault(session_id, loaded)
+                self._loading.pop(session_id, None)
+                if session is loaded:
+                    print(f"--- Session '{session_id}' loaded ---")
+                return self._use(session)
+
+    def _use(self, session: Session) -> Session:
+        """Marks a cached session in use. Caller holds _lock."""
+        self._sessions.move_to_end(session.id)
+        session.active += 1
+        session.last_used = time.monotonic()
+        self._evict()
+        return session
+
+    def release(self, session: Session):
+        with self._lock:
+            session.active -= 1
+            session.last_used = time.monotonic()
+
+    def loaded(self) -> list:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def save_all(self):
+        """Writes every loaded session's state; history is already journaled."""
+        for session in self.loaded():
+            self._save_state(session)
@@ -0,0 +1,132 @@
+### Speculative Prefill ###
+# Evaluates a session's next prompt into the LLM's KV cache before /chat
+# arrives: right after a reply (system prompt, memories, hot turns, context)
+# and again for each draft of the next message (partial transcripts, text
+# being typed). When the real message lands, llama.cpp's prefix matching
+# only evaluates what the draft got wrong.
+#
+# Runs on the LLM worker at background priority, in small chunks, and stops
+# between chunks as soon as a real request is waiting or a newer draft came
+# in. Stale work costs nothing to discard: the next prompt just overwrites
+# the KV cache from the first token that differs.
+
+### Imports ###
+import threading
+import time
+
+
+### Config ###
+PREFILL_CHUNK = 32      # Tokens evaluated between checks for newer work
+
+
+def common_prefix(a, b) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class Speculator:
+    """Speculative prefills against one llama-cpp model: supersession and saved/wasted accounting."""
+
+    def __init__(self, chunk: int = PREFILL_CHUNK):
+        self.chunk = chunk
+        self.generation = 0          # Bumped per request; older ones stop at their next chunk
+        self.last_key = None         # Last speculated (session, history length, draft), to skip repeats
+        self._lock = threading.Lock()
+
+        # KV positions speculation filled since the last real prompt
+        self._span_start = None
+        self._span_end = 0
+        self.unclaimed = 0           # Tokens evaluated since the last real prompt
+        self.seconds_per_token = 0.0 # Speculative prefill speed, for estimating time saved
+
+        # Stats
+        self.runs = 0
+        self.aborted = 0
+        self.tokens_evaluated = 0
+        self.tokens_saved = 0
+        self.tokens_wasted = 0
+        self.seconds_spent = 0.0
+        self.seconds_saved = 0.0
+
+    def begin(self, key) -> int | None:
+        """Starts a new speculation, superseding older ones. None if `key` is what was just speculated."""
+        with self._lock:
+            if key == self.last_key:
+                return None
+            self.last_key = key
+            self.generation += 1
+            return self.generation
+
+    def current(self, generation: int) -> bool:
+        return generation == self.generation
+
+    def prefill(self, llm, tokens: list, generation: int, should_yield) -> int:
+        """
+        Runs on the LLM worker. Evaluates `tokens` past what llm's KV cache
+        already holds, PREFILL_CHUNK at a time, until done, superseded, or
+        should_yield() says a real request is waiting. Returns tokens evaluated.
+        """
+        common = common_prefix(llm.input_ids[:llm.n_tokens], tokens)
+        llm.n_tokens = common
+        done = common
+        start = time.perf_counter()
+        while done < len(tokens):
+            if not self.current(generation) or should_yield():
+                self.aborted += 1
+                break
+            llm.eval(tokens[done:done + self.chunk])
+            done = min(done + self.chunk, len(tokens))
+        seconds = time.perf_counter() - start
+
+        evaluated = done - common
+        with self._lock:
+            self.runs += 1
+            if evaluated:
+                self._span_start = common if self._span_start is None else min(self._span_start, common)
+                self._span_end = done
+                self.unclaimed += evaluated
+                self.tokens_evaluated += evaluated
+                self.seconds_spent += seconds
+                self.seconds_per_token = self.seconds_spent / self.tokens_evaluated
+        return evaluated
+
+    def claim(self, llm, tokens: list) -> tuple[int, int]:
+        """
+        Runs on the LLM worker right before a real completion of `tokens`.
+        Counts how much speculative work it reuses and how much was wasted.
+        Returns (tokens saved, tokens wasted).
+        """
+        with self._lock:
+            if not self.unclaimed:
+                return 0, 0
+            reused = common_prefix(llm.input_ids[:llm.n_tokens], tokens)
+            saved = max(0, min(reused, self._span_end) - self._span_start)
+            saved = min(saved, self.unclaimed)
+            wasted = self.unclaimed - saved
+
+            self.tokens_saved += saved
+            self.tokens_wasted += wasted
+            self.seconds_saved += saved * self.seconds_per_token
+            self.unclaimed = 0
+            self._span_start = None
+            self._span_end = 0
+            self.last_key = None
+            return saved, wasted
+
+    def stats(self) -> dict:
+        with self._lock:
+            claimed = self.tokens_saved + self.tokens_wasted
+            return {
+                "runs": self.runs,
+                "aborted": self.aborted,
+                "tokens_evaluated": self.tokens_evaluated,
+                "tokens_saved": self.tokens_saved,
+                "tokens_wasted": self.tokens_wasted,
+                "hit_rate": round(self.tokens_saved / claimed, 3) if claimed else 0.0,
+                "seconds_spent": round(self.seconds_spent, 3),
+                "ttft_seconds_saved": round(self.seconds_saved, 3),
+            }
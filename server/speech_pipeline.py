@@ -0,0 +1,96 @@
+### Speech Pipeline ###
+# Sentence-pipelined TTS for streamed replies.
+# Text is cut at sentence boundaries while the LLM is still generating,
+# each finished sentence is synthesized on a worker, and audio comes back in order.
+
+### Imports ###
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+### Config ###
+# Sentence end = terminal punctuation (plus closing quotes/brackets) followed by
+# whitespace, or a line break. Requiring the whitespace keeps "3.5" and an
+# unfinished "..." from being cut early.
+SENTENCE_END_RE = re.compile(r"[.!?…]+[\"')\]*~]*(?=\s)|\n")
+MIN_SENTENCE_CHARS = 2       # Skip stray fragments like "." or "-"
+
+# Kokoro runs one synthesis at a time; a single worker also keeps submission order
+_tts_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vesi-tts")
+
+
+class SentenceSplitter:
+    """
+    Incremental sentence cutter. feed() takes raw text deltas and returns the
+    sentences completed so far; flush() returns whatever is left.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.consumed = 0     # Offset into self.text already handed out
+
+    def feed(self, delta: str) -> list[str]:
+        self.text += delta
+        sentences = []
+        for match in SENTENCE_END_RE.finditer(self.text, self.consumed):
+            sentence = self.text[self.consumed:match.end()].strip()
+            self.consumed = match.end()
+            if len(sentence) >= MIN_SENTENCE_CHARS:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self) -> str | None:
+        """Returns the unfinished tail once the text is complete."""
+        tail = self.text[self.consumed:].strip()
+        self.consumed = len(self.text)
+        return tail if len(tail) >= MIN_SENTENCE_CHARS else None
+
+
+class SpeechPipeline:
+    """
+    Feeds streamed text through a SentenceSplitter and submits every complete
+    sentence to `synthesize(text, index)` on a worker. Results are yielded strictly in
+    sentence order as (index, sentence, result).
+    """
+
+    def __init__(self, synthesize, submit=None):
+        self.synthesize = synthesize
+        self.submit = submit or _tts_worker.submit
+        self.splitter = SentenceSplitter()
+        self.pending = deque()
+        self.submitted = 0
+
+    def _queue(self, sentence: str):
+        future = self.submit(self.synthesize, sentence, self.submitted)
+        self.pending.append((self.submitted, sentence, future))
+        self.submitted += 1
+
+    def feed(self, delta: str):
+        """Adds a text delta; queues synthesis for every sentence it completes."""
+        for sentence in self.splitter.feed(delta):
+            self._queue(sentence)
+
+    def finish(self):
+        """Queues the trailing partial sentence once generation is over."""
+        tail = self.splitter.flush()
+        if tail:
+            self._queue(tail)
+
+    def cancel(self):
+        """Drops the sentences not synthesized yet (barge-in). One already running finishes unused."""
+        while self.pending:
+            _, _, future = self.pending.popleft()
+            future.cancel()
+
+    def ready(self):
+        """Yields finished chunks without blocking, stopping at the first one still running."""
+        while self.pending and self.pending[0][2].done():
+            index, sentence, future = self.pending.popleft()
+            yield index, sentence, future.result()
+
+    def drain(self):
+        """Yields all remaining chunks in order, waiting for each one."""
+        while self.pending:
+            index, sentence, future = self.pending.popleft()
+            yield index, sentence, future.result()
@@ -0,0 +1,99 @@
+### STT Micro-batching ###
+# Collects /transcribe requests that arrive close together and decodes them
+# as one Whisper batch, then hands each caller its own text. Whisper pads
+# every clip to a 30 s window, so a batch of N short clips costs little more
+# than one on a GPU.
+#
+# The first request of a batch waits at most MAX_WAIT for company; requests
+# that arrive while a batch is running go out together in the next one.
+# A lone request runs through the regular single-clip path, unchanged.
+
+### Imports ###
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from metrics import observe
+from scheduler import QueueFullError
+
+
+### Config ###
+MAX_BATCH = 8            # Clips decoded together
+MAX_WAIT = 0.010         # Seconds the first clip of a batch waits for more
+MAX_PENDING = 64         # Clips waiting for a batch before /transcribe answers 503
+
+
+class STTBatcher:
+    """
+    Micro-batching queue in front of the STT model.
+    run_single(audio) -> text handles a lone clip, run_batch([audio, ...]) ->
+    [text, ...] several; both should go through the model's scheduler queue.
+    """
+
+    def __init__(self, run_single, run_batch, max_batch: int = MAX_BATCH,
+                 max_wait: float = MAX_WAIT, max_pending: int = MAX_PENDING):
+        self.run_single = run_single
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self._pending = queue.Queue()
+
+        # Stats
+        self.batches = 0
+        self.clips = 0
+        self.largest_batch = 0
+
+        self._worker = threading.Thread(target=self._run, name="vesi-stt-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, audio) -> Future:
+        """Queues one clip; its Future resolves to the text. Raises QueueFullError when full."""
+        if self._pending.qsize() >= self.max_pending:
+            raise QueueFullError("stt", self._pending.qsize())
+        future = Future()
+        self._pending.put((time.perf_counter(), audio, future))
+        return future
+
+    def _collect(self) -> list:
+        """Blocks for the first clip, then takes more until the batch is full or its wait is up."""
+        first = self._pending.get()
+        batch = [first]
+        deadline = first[0] + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._pending.get(timeout=max(0.0, deadline - time.perf_counter())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [job for job in self._collect() if job[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            audios = [audio for _, audio, _ in batch]
+            try:
+                texts = self.run_batch(audios) if len(audios) > 1 else [self.run_single(audios[0])]
+            except BaseException as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.clips += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            observe("stt.batch_size", len(batch))
+            for (_, _, future), text in zip(batch, texts):
+                future.set_result(text)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._pending.qsize(),
+            "batches": self.batches,
+            "clips": self.clips,
+            "avg_batch": round(self.clips / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
@@ -0,0 +1,71 @@
+### Streaming STT ###
+# Incremental transcription while push-to-talk is held.
+# Audio chunks (MediaRecorder webm/ogg pieces) accumulate into one stream.
+# Each partial pass decodes it and runs Whisper over a rolling window of
+# the uncommitted tail only; segments that end well before the window edge
+# are committed, so the final pass on release only re-decodes the last few seconds.
+
+### Imports ###
+import audio_io
+from audio_io import STT_SAMPLE_RATE, decode_audio, trim_silence
+
+
+### Config ###
+PARTIAL_INTERVAL = 0.5    # Seconds between partial hypotheses
+WINDOW_SECONDS = 10.0     # Uncommitted audio before the oldest segments get committed
+COMMIT_MARGIN = 2.0       # Segments ending closer than this to the window edge stay open
+PARTIAL_BEAM_SIZE = 1     # Greedy for partials, speed over accuracy
+FINAL_BEAM_SIZE = 5       # Same as /transcribe
+
+
+class StreamingTranscriber:
+    """
+    State for one push-to-talk stream. partial() and final() take
+    `run(audio, beam_size) -> [(start, end, text), ...]` and are meant
+    to run on the STT worker.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.committed_at = 0         # Sample offset up to which text is final
+        self.committed_text = []
+        self.last_partial = ""
+
+    def add(self, chunk: bytes):
+        self.data.extend(chunk)
+
+    def _tail(self):
+        audio = decode_audio(bytes(self.data))
+        return audio[self.committed_at:]
+
+    def partial(self, run) -> str:
+        """Transcribes the uncommitted tail and returns committed + tentative text."""
+        if not self.data:
+            return self.last_partial
+        tail = self._tail()
+        if len(tail) == 0:
+            return self.last_partial
+
+        segments = run(tail, PARTIAL_BEAM_SIZE)
+        tail_seconds = len(tail) / STT_SAMPLE_RATE
+
+        # Window full: freeze the segments that can't change anymore
+        if tail_seconds > WINDOW_SECONDS:
+            stable = [s for s in segments if s[1] <= tail_seconds - COMMIT_MARGIN]
+            if stable:
+                self.committed_text.extend(s[2].strip() for s in stable)
+                self.committed_at += int(stable[-1][1] * STT_SAMPLE_RATE)
+                segments = segments[len(stable):]
+
+        self.last_partial = " ".join(self.committed_text + [s[2].strip() for s in segments]).strip()
+        return self.last_partial
+
+    def final(self, run) -> str:
+        """Full-beam pass over the remaining tail. Call once the mic is released."""
+        if not self.data:
+            return ""
+        tail = self._tail()
+        if audio_io.VAD_TRIM:
+            tail = trim_silence(tail)
+        segments = run(tail, FINAL_BEAM_SIZE) if len(tail) else []
+        return " ".join(self.committed_text + [s[2].strip() for s in segments]).strip()
@@ -0,0 +1,22 @@
+### Test setup ###
+# Tests import the server modules directly and run on the stand-ins from
+# fakes.py, so no models, GPU or model files are needed:
+#   cd server && python -m pytest tests
+
+### Imports ###
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    """main.py wired to fast fakes and a throwaway log dir, the way bench.py sets it up."""
+    import bench
+
+    args = SimpleNamespace(real=False, tts_cache=False, reply_repeat=1, prefill_latency=0.0, token_latency=0.001,
+                           stt_latency=0.0, tts_latency=0.0, stt_batch_latency=0.0)
+    return bench.setup(args, tmp_path_factory.mktemp("vesi"))
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+
+
+def test_cancel_while_queued_records_the_users_message(main):
+    session_id = "cancel_queued"
+
+    async def scenario():
+        gate = threading.Event()
+        main.scheduler.submit("llm", gate.wait)      # Keeps the turn queued behind it
+        task = asyncio.create_task(main.chat(main.ChatRequest(
+            message="Are you there?", session_id=session_id, request_id="queued-1",
+        )))
+        while not main.turns.running(session_id):
+            await asyncio.sleep(0.005)
+        main.turns.cancel(request_id="queued-1")
+        gate.set()
+        return await task
+
+    response = asyncio.run(scenario())
+    assert response == {"request_id": "queued-1", "cancelled": True, "reason": "cancelled"}
+
+    session = main.sessions.acquire(session_id)
+    try:
+        assert (session.history[-1]["role"], session.history[-1]["content"]) == ("user", "Are you there?")
+    finally:
+        main.sessions.release(session)
+
+
+def test_chat_reply_is_recorded(main):
+    response = asyncio.run(main.chat(main.ChatRequest(message="Hello?", session_id="plain")))
+    assert response["text"] and "mood_signals" in response
+
+    session = main.sessions.acquire("plain")
+    try:
+        assert [m["role"] for m in session.history[-2:]] == ["user", "assistant"]
+    finally:
+        main.sessions.release(session)
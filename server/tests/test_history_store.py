@@ -0,0 +1,26 @@
+from history_store import HistoryStore
+
+
+def test_torn_journal_line_does_not_swallow_the_next_record(tmp_path):
+    path = tmp_path / "chat_log.json"
+    store = HistoryStore(path)
+    history = [{"role": "system", "content": "You are Vesi."}]
+    store.write_snapshot(history)
+    history.append({"role": "user", "content": "hi"})
+    store.append(history[-1:], history)
+
+    # Crash halfway through writing the reply
+    with open(store.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "append", "entry": {"role": "assistant", "cont')
+
+    store = HistoryStore(path)
+    history = store.load()
+    assert [m["content"] for m in history] == ["You are Vesi.", "hi"]
+
+    history.append({"role": "user", "content": "still there?"})
+    store.append(history[-1:], history)
+    history.append({"role": "assistant", "content": "Hmph."})
+    store.append(history[-1:], history)
+
+    reloaded = HistoryStore(path).load()
+    assert [m["content"] for m in reloaded] == ["You are Vesi.", "hi", "still there?", "Hmph."]
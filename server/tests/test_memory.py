@@ -0,0 +1,34 @@
+from memory import MEMORY_PINNED, RECALL_HEADER, build_messages, entry_tokens, set_tokenizer
+
+
+def tokenize(text: str) -> list:
+    return text.split()
+
+
+def test_recalled_memories_do_not_break_an_idle_speculative_prefill():
+    blocks = [{"role": "system", "type": "compressed_block", "level": 1, "content": f"MEMORY: block {i}"}
+              for i in range(MEMORY_PINNED + 2)]
+    turns = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i}"} for i in range(6)]
+    history = [{"role": "system", "content": "You are Vesi."}] + blocks + turns
+    context = {"role": "system", "content": "CONTEXT: now"}
+
+    # Idle speculation: no user message yet, so nothing recalled
+    speculated, _ = build_messages(history + [{"role": "user", "content": ""}], tokenize, context=context, recalled=[])
+    real, _ = build_messages(history + [{"role": "user", "content": "remember block 3?"}], tokenize,
+                             context=context, recalled=[blocks[-1]])
+
+    assert real[-2]["content"].startswith(RECALL_HEADER)
+    assert real[:-2] == speculated[:-1]
+
+
+def test_token_counts_saved_for_another_model_are_recounted():
+    entry = {"role": "user", "content": "hello there"}
+    try:
+        set_tokenizer("model-a.gguf")
+        n = entry_tokens(entry, tokenize)
+        assert entry_tokens(entry, lambda text: []) == n       # Cached for this model
+
+        set_tokenizer("model-b.gguf")
+        assert entry_tokens(entry, lambda text: tokenize(text) * 2) == 2 * n
+    finally:
+        set_tokenizer(None)
@@ -0,0 +1,39 @@
+import time
+from fakes import FakeKokoro
+from speech_pipeline import SpeechPipeline
+
+
+REPLY = "Hmph, you again. I suppose I can spare a minute for you. Don't get the wrong idea."
+
+
+def generate(reply: str, token_latency: float = 0.02):
+    """Word pieces of `reply`, one every `token_latency` seconds, like a streaming LLM."""
+    for i, word in enumerate(reply.split(" ")):
+        time.sleep(token_latency)
+        yield word if i == 0 else " " + word
+
+
+def test_first_sentence_is_spoken_while_the_second_is_generated():
+    tts = FakeKokoro(base_latency=0.05, latency_per_char=0.0)
+    synthesized = {}      # sentence index -> (start, end)
+
+    def synthesize(sentence, index):
+        start = time.perf_counter()
+        tts.create(sentence)
+        synthesized[index] = (start, time.perf_counter())
+
+    pipeline = SpeechPipeline(synthesize)
+    completed_at = {}     # sentence index -> when generation finished it
+    for token in generate(REPLY):
+        pipeline.feed(token)
+        for index in range(pipeline.submitted):
+            completed_at.setdefault(index, time.perf_counter())
+    pipeline.finish()
+    list(pipeline.drain())
+
+    assert len(synthesized) == 3
+    tts_start, tts_end = synthesized[0]
+    # Sentence 2 is generated between sentence 1 completing and itself completing
+    assert tts_start < completed_at[1]
+    assert tts_end > completed_at[0]
+    assert tts_end < completed_at[1]
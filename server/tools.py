@@ -1,10 +1,27 @@
 ### Tool System ###
 # Context injection for Vesi. Two types:
-# Passive — always injected 
-# Active  — keyword-triggered 
+# Passive — always injected
+# Active  — keyword-triggered
+#
+# Tools run concurrently on a small thread pool. Each has a deadline
+# ("timeout", seconds): a tool that misses it is left out of this prompt
+# (its result is still cached when it lands). Results are cached for "ttl"
+# seconds, in windows aligned to the wall clock, so a 60s TTL means at most
+# once per clock minute.
 
 ### Imports ###
 import datetime
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from metrics import record
+
+
+### Config ###
+TOOL_WORKERS = 4          # Tools that can run at once
+DEFAULT_TIMEOUT = 1.0     # Seconds a tool gets before its context is dropped
+DEFAULT_TTL = 0           # Seconds a result is reused; 0 = run every time
 
 
 ### Tool functions ###
@@ -22,6 +39,7 @@ PASSIVE_TOOLS = [
         "name": "get_time",
         "func": get_time,
         "template": "Current date and time: {result}",
+        "ttl": 60,             # Minute resolution: recompute once per minute
     },
 ]
 
@@ -33,27 +51,119 @@ ACTIVE_TOOLS = [
     #     "keywords": ["weather", "forecast", "temperature outside"],
     #     "func": get_weather,
     #     "template": "Current weather: {result}",
+    #     "timeout": 2.0,      # Optional, default DEFAULT_TIMEOUT
+    #     "ttl": 600,          # Optional, default DEFAULT_TTL
     # },
 ]
 
 
-### Engine Functions ###
+### Engine ###
 
-def get_passive_context() -> str:
-    """Run all passive tools. Returns context string to append to system prompt."""
+_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="vesi-tool")
+_lock = threading.Lock()
+_cache = {}       # tool name -> (TTL window, result)
+_running = {}     # tool name -> Future, so concurrent prompts share one call
+
+
+def _compile_triggers(tools: list):
+    """
+    One regex over every active tool's keywords, plus keyword -> tool names.
+    A zero-width lookahead, so keywords that overlap each other all trigger.
+    At one position the regex reports only the longest keyword; shorter ones
+    matching there are its prefixes, so each keyword also names their tools.
+    """
+    by_keyword = {}
+    for tool in tools:
+        for keyword in tool["keywords"]:
+            by_keyword.setdefault(keyword.lower(), set()).add(tool["name"])
+    if not by_keyword:
+        return None, by_keyword
+    alternatives = "|".join(re.escape(kw) for kw in sorted(by_keyword, key=len, reverse=True))
+    triggers = {
+        kw: {name for prefix, names in by_keyword.items() if kw.startswith(prefix) for name in names}
+        for kw in by_keyword
+    }
+    return re.compile(f"(?=({alternatives}))"), triggers
+
+
+_triggers, _tools_by_keyword = _compile_triggers(ACTIVE_TOOLS)
+
+
+def _window(tool: dict) -> int | None:
+    ttl = tool.get("ttl", DEFAULT_TTL)
+    return int(time.time() // ttl) if ttl else None
+
+
+def _call(tool: dict):
+    start = time.perf_counter()
+    result = tool["func"]()
+    record(f"tool.{tool['name']}", time.perf_counter() - start)
+    return result
+
+
+def _submit(tool: dict) -> Future:
+    """A Future for the tool's result: already done on a cache hit."""
+    name = tool["name"]
+    window = _window(tool)
+    with _lock:
+        cached = _cache.get(name)
+        if window is not None and cached and cached[0] == window:
+            future = Future()
+            future.set_result(cached[1])
+            return future
+        future = _running.get(name)
+        if future is not None:
+            return future
+        future = _running[name] = _pool.submit(_call, tool)
+    # Outside the lock: runs right here if the tool already finished
+    future.add_done_callback(lambda f: _finished(name, window, f))
+    return future
+
+
+def _finished(name: str, window: int | None, future):
+    with _lock:
+        _running.pop(name, None)
+        if window is not None and not future.cancelled() and future.exception() is None:
+            _cache[name] = (window, future.result())
+
+
+def run_tools(tools: list) -> list[str]:
+    """
+    Runs `tools` concurrently and returns their formatted results in order,
+    leaving out any that fail or miss their deadline.
+    """
+    start = time.monotonic()
+    pending = [(tool, _submit(tool)) for tool in tools]
     results = []
-    for tool in PASSIVE_TOOLS:
-        result = tool["func"]()
+    for tool, future in pending:
+        timeout = tool.get("timeout", DEFAULT_TIMEOUT)
+        try:
+            result = future.result(timeout=max(0.0, start + timeout - time.monotonic()))
+        except TimeoutError:
+            print(f"--- Tool {tool['name']} missed its {timeout}s deadline, skipped ---")
+            continue
+        except Exception as e:
+            print(f"--- Tool {tool['name']} failed: {e} ---")
+            continue
         results.append(tool["template"].format(result=result))
-    return "\n".join(results)
+    return results
+
+
+def match_active_tools(user_input: str) -> list:
+    """Active tools whose keywords appear in `user_input`, in registry order."""
+    if _triggers is None:
+        return []
+    names = {name for kw in set(_triggers.findall(user_input.lower())) for name in _tools_by_keyword[kw]}
+    return [tool for tool in ACTIVE_TOOLS if tool["name"] in names]
+
+
+def get_passive_context() -> str:
+    """Run all passive tools. Returns context string to append to system prompt."""
+    return "\n".join(run_tools(PASSIVE_TOOLS))
 
 
 def run_active_tools(user_input: str) -> str | None:
     """Scan user input for keyword matches, run matching active tools."""
-    lower = user_input.lower()
-    results = []
-    for tool in ACTIVE_TOOLS:
-        if any(kw in lower for kw in tool["keywords"]):
-            result = tool["func"]()
-            results.append(tool["template"].format(result=result))
+    matched = match_active_tools(user_input)
+    results = run_tools(matched) if matched else []
     return "\n".join(results) if results else None
@@ -0,0 +1,177 @@
+### TTS Cache ###
+# Synthesized speech keyed by whitespace-normalized text + voice + speed bucket.
+# Vesi's replies repeat a lot ("Hmph.", "Baka.", stock openers), so Kokoro
+# output is kept in a RAM LRU and, if a cache dir is set, on disk with
+# size-based eviction. Works on whatever text it is given: whole /chat
+# replies and the single sentences /chat/stream synthesizes.
+
+### Imports ###
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+
+
+### Config ###
+RAM_MAX_BYTES = 64 * 1024 * 1024      # Decoded float32 samples kept in memory
+DISK_MAX_BYTES = 512 * 1024 * 1024    # .npy files kept in the cache dir
+SPEED_BUCKET = 0.05                   # Speeds this close share an entry
+KEY_VERSION = 2                       # Bump when keys change; old disk entries then miss and get evicted
+
+
+def normalize_text(text: str) -> str:
+    """
+    Whitespace doesn't change what Kokoro says. Case can ("US" vs "us") and
+    punctuation does (prosody), so both stay.
+    """
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class TTSCache:
+    """
+    Wraps a Kokoro-style `create(text, voice=, speed=, lang=) -> (samples, sample_rate)`.
+    Thread-safe; hits never touch the model.
+    """
+
+    def __init__(self, cache_dir: Path | None = None,
+                 ram_max_bytes: int = RAM_MAX_BYTES, disk_max_bytes: int = DISK_MAX_BYTES):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.ram_max_bytes = ram_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.entries = OrderedDict()     # key -> (samples, sample_rate, synthesis seconds)
+        self.ram_bytes = 0
+        self.disk_bytes = None           # Scanned lazily
+        self._lock = threading.Lock()
+
+        # Stats
+        self.ram_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0             # Audio bytes served without synthesizing
+        self.seconds_saved = 0.0         # Kokoro time those hits would have cost
+
+    @staticmethod
+    def key(text: str, voice: str, speed: float) -> str:
+        bucket = round(speed / SPEED_BUCKET) * SPEED_BUCKET
+        raw = f"{KEY_VERSION}|{voice}|{bucket:.2f}|{normalize_text(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def create(self, model, text: str, voice: str, speed: float, lang: str):
+        """Cached model.create(text, voice=voice, speed=speed, lang=lang)."""
+        key = self.key(text, voice, speed)
+        cached = self._get(key)
+        if cached is not None:
+            samples, sample_rate = cached
+            return samples, sample_rate
+
+        start = time.perf_counter()
+        samples, sample_rate = model.create(text, voice=voice, speed=speed, lang=lang)
+        samples = np.asarray(samples, dtype=np.float32)
+        self._put(key, samples, sample_rate, time.perf_counter() - start)
+        return samples, sample_rate
+
+    ### Tiers ###
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npy"
+
+    def _get(self, key: str):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.ram_hits += 1
+                self._count_saved(entry)
+                return entry[0], entry[1]
+
+        if not self.cache_dir:
+            with self._lock:
+                self.misses += 1
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                sample_rate = int(np.load(f))
+                seconds = float(np.load(f))
+                samples = np.load(f)
+            os.utime(path)     # mtime doubles as last use for eviction
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        entry = (samples, sample_rate, seconds)
+        with self._lock:
+            self.disk_hits += 1
+            self._count_saved(entry)
+            self._remember(key, entry)
+        return samples, sample_rate
+
+    def _count_saved(self, entry):
+        self.bytes_saved += entry[0].nbytes
+        self.seconds_saved += entry[2]
+
+    def _remember(self, key: str, entry):
+        """Adds to the RAM tier, evicting least recently used. Caller holds _lock."""
+        if key in self.entries:
+            return
+        self.entries[key] = entry
+        self.ram_bytes += entry[0].nbytes
+        while self.ram_bytes > self.ram_max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.ram_bytes -= evicted[0].nbytes
+
+    def _put(self, key: str, samples: np.ndarray, sample_rate: int, seconds: float):
+        with self._lock:
+            self._remember(key, (samples, sample_rate, seconds))
+        if self.cache_dir:
+            try:
+                self._write_disk(key, samples, sample_rate, seconds)
+            except OSError as e:
+                print(f"--- Could not write TTS cache entry: {e} ---")
+
+    def _write_disk(self, key: str, samples: np.ndarray, sample_rate: int, seconds: float):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._disk_path(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.int64(sample_rate))
+            np.save(f, np.float64(seconds))
+            np.save(f, samples)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self.disk_bytes is None:
+                self.disk_bytes = sum(p.stat().st_size for p in self.cache_dir.glob("*.npy"))
+            else:
+                self.disk_bytes += path.stat().st_size
+            if self.disk_bytes <= self.disk_max_bytes:
+                return
+
+            # Oldest-used first until back under the limit
+            files = sorted(self.cache_dir.glob("*.npy"), key=lambda p: p.stat().st_mtime)
+            for stale in files:
+                if self.disk_bytes <= self.disk_max_bytes:
+                    break
+                size = stale.stat().st_size
+                stale.unlink(missing_ok=True)
+                self.disk_bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.ram_hits + self.disk_hits + self.misses
+            return {
+                "ram_hits": self.ram_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.ram_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "seconds_saved": round(self.seconds_saved, 2),
+                "ram_entries": len(self.entries),
+                "ram_bytes": self.ram_bytes,
+                "disk_bytes": self.disk_bytes or 0,
+            }
@@ -0,0 +1,116 @@
+### Turns ###
+# In-flight /chat and /chat/stream requests, so the user can barge in.
+# Every turn carries a CancelToken that generation checks between tokens and
+# speech checks between sentences. A new turn in a session supersedes the
+# one still running there; /chat/cancel cancels one by request id.
+
+### Imports ###
+import threading
+import uuid
+
+
+### Config ###
+HANDOFF_TIMEOUT = 5.0     # Seconds a new turn waits for the one it superseded to record itself
+
+
+class TurnCancelled(Exception):
+    """Raised by CancelToken.check() once the turn was cancelled."""
+
+
+class CancelToken:
+    """Cooperative cancellation flag for one turn. Thread-safe."""
+
+    def __init__(self, request_id: str, session_id: str):
+        self.request_id = request_id
+        self.session_id = session_id
+        self.reason = None
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise TurnCancelled(self.reason)
+
+
+class TurnRegistry:
+    """request id -> CancelToken of running turns, at most one per session."""
+
+    def __init__(self, handoff_timeout: float = HANDOFF_TIMEOUT):
+        self.handoff_timeout = handoff_timeout
+        self._by_request = {}
+        self._by_session = {}
+        self._lock = threading.Lock()
+
+    def start(self, session_id: str, request_id: str | None = None) -> CancelToken:
+        """
+        Registers a turn and cancels the session's running one, then waits
+        until that one has recorded what it delivered, so history stays in
+        order. Blocking: call off the event loop. Raises ValueError on a
+        request id that is already running.
+        """
+        token = CancelToken(request_id or uuid.uuid4().hex, session_id)
+        with self._lock:
+            if token.request_id in self._by_request:
+                raise ValueError(f"Request {token.request_id} is already running")
+            previous = self._by_session.get(session_id)
+            self._by_session[session_id] = token
+            self._by_request[token.request_id] = token
+
+        if previous:
+            previous.cancel("superseded")
+            if not previous._finished.wait(self.handoff_timeout):
+                print(f"--- Turn {previous.request_id} is slow to stop, starting the next one anyway ---")
+        return token
+
+    def cancel(self, request_id: str | None = None, session_id: str | None = None) -> CancelToken | None:
+        """Cancels a running turn by request id or session. Returns its token, or None if none is running."""
+        with self._lock:
+            token = self._by_request.get(request_id) if request_id else self._by_session.get(session_id)
+        if token:
+            token.cancel()
+        return token
+
+    def running(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._by_session
+
+    def finish(self, token: CancelToken):
+        """Unregisters a turn once its history is recorded."""
+        with self._lock:
+            self._by_request.pop(token.request_id, None)
+            if self._by_session.get(token.session_id) is token:
+                del self._by_session[token.session_id]
+        token._finished.set()
+
+
+def until_cancelled(items, token: CancelToken):
+    """
+    Passes items through until the turn is cancelled, checking after each one,
+    so a model stream stops before computing its next token. Closes `items`.
+    """
+    try:
+        if token.cancelled:
+            return
+        for item in items:
+            yield item
+            if token.cancelled:
+                return
+    finally:
+        close = getattr(items, "close", None)
+        if close:
+            close()
+
+
+def unless_cancelled(token: CancelToken, fn, *args):
+    """fn(*args), unless the turn was cancelled while the job sat in a queue."""
+    token.check()
+    return fn(*args)